@@ -0,0 +1,237 @@
+"""
+Backtests
+
+replay() feeds history one row at a time through Trader.receive_tick against a MockClient.
+run_vectorized() gets the same answer by running the vectorized generators once over each
+underlying's full (train + test) close array and working out, per position, the first bar at
+which any sell condition fires.
+
+The replay semantics it reproduces:
+
+- ticks are merged by datetime (tick_merge.py), ties going to the symbol earlier in the ticks
+  dict, then to row order
+- every underlying tick re-evaluates every underlying, so an underlying is first evaluated on
+  its training history alone if another underlying ticks before it
+- a firing underlying sells every leg held on it, filled at the leg's last close replayed before
+  the firing tick
+"""
+import numpy as np
+import pandas as pd
+
+from seller import Trader, GENERATORS, VECTORIZED_GENERATORS
+from mock_broker import MockClient
+from tick_store import to_utc_ns
+from tick_merge import merge_ticks
+from symbols import is_option
+
+RESULT_COLUMNS = ['symbol', 'underlyingSymbol', 'quantity', 'averagePrice', 'sold', 'fillPrice', 'soldAt',
+                  'reasons', 'pnl']
+
+
+def compute_conditions(close, generators=VECTORIZED_GENERATORS):
+    signals, ready, conditions = {}, {}, {}
+    for signal_generator in generators['signals']:
+        signal_generator(close, signals, ready)
+    for condition_generator in generators['conditions']:
+        conditions.update(condition_generator(close, signals, ready))
+    return conditions
+
+
+def first_fire(conditions, n_train, n_test, from_initial):
+    """
+    First history length (k test rows replayed) whose evaluation fires any condition.
+
+    Returns (k, reasons) or (None, []) when nothing fires. k == 0 means the training history
+    alone fired, which can only happen when another underlying ticked before this one (from_initial).
+    """
+    if not conditions or n_test == 0 and not from_initial:
+        return None, []
+
+    start = n_train - 1 if from_initial else n_train
+    end = n_train + n_test
+    fired = np.zeros(end - max(start, 0), dtype=bool)
+    for mask in conditions.values():
+        fired |= mask[max(start, 0):end]
+
+    hits = np.flatnonzero(fired)
+    if len(hits) == 0:
+        return None, []
+    row = max(start, 0) + hits[0]
+    return row - n_train + 1, sorted(name for name, mask in conditions.items() if mask[row])
+
+
+def _close(df):
+    return df['close'].to_numpy(dtype=np.float64) if len(df) else np.empty(0)
+
+
+def _datetime(df, idx):
+    return df['datetime'].iloc[idx] if 'datetime' in df and len(df) > idx else None
+
+
+def _datetimes(df):
+    # UTC, NaT where there's no datetime (those rows replay first)
+    if 'datetime' not in df:
+        return np.full(len(df), np.datetime64('NaT'), dtype='M8[ns]')
+    return to_utc_ns(df['datetime'])[0] if len(df) else np.empty(0, 'M8[ns]')
+
+
+def _multiplier(symbol):
+    return 100 if is_option(symbol) else 1
+
+
+def build_results(positions, fills):
+    """
+    P/L table, one row per position.
+
+    fills maps symbol -> {'price', 'datetime', 'reasons'} for every leg that was sold.
+    """
+    rows = []
+    for position in positions.to_dict(orient='records'):
+        symbol = position['symbol']
+        quantity = position['longQuantity'] if position['longQuantity'] != 0 else position['shortQuantity']
+        fill = fills.get(symbol)
+        row = {
+            'symbol': symbol,
+            'underlyingSymbol': position['underlyingSymbol'],
+            'quantity': quantity,
+            'averagePrice': position['averagePrice'],
+            'sold': fill is not None,
+            'fillPrice': fill['price'] if fill else np.nan,
+            'soldAt': fill['datetime'] if fill else None,
+            'reasons': ', '.join(fill['reasons']) if fill else '',
+        }
+        row['pnl'] = (row['fillPrice'] - row['averagePrice']) * quantity * _multiplier(symbol) if fill else np.nan
+        rows.append(row)
+
+    return pd.DataFrame.from_records(rows, columns=RESULT_COLUMNS)
+
+
+def total_pnl(results):
+    return results['pnl'].sum(skipna=True)
+
+
+def plan_positions(positions, initial_data, ticks):
+    """
+    Flatten a replay into plain arrays plus one small plan per position.
+
+    arrays holds '<underlying>.close' (train + test), '<symbol>.datetime' (test, UTC) and
+    '<leg>.close' (test). Plans only carry scalars, so they are cheap to ship to other processes
+    while the arrays can be shared (see sweep.py).
+    """
+    order = {symbol: i for i, symbol in enumerate(ticks)}
+    underlyings = [symbol for symbol in ticks if not is_option(symbol)]
+
+    # the first underlying tick of the replay, evaluates every underlying on its training data
+    firsts = [(int(_datetimes(ticks[symbol])[:1].view('i8')[0]), order[symbol], symbol)
+              for symbol in underlyings if len(ticks[symbol])]
+    first_ns, first_rank, first_underlying = min(firsts) if firsts else (None, None, None)
+
+    arrays, plans = {}, []
+    for position in positions.to_dict(orient='records'):
+        symbol = position['symbol']
+        underlying = symbol if not is_option(symbol) else position['underlyingSymbol']
+        if underlying not in ticks:
+            continue
+
+        train = initial_data.get(underlying, pd.DataFrame())
+        test = ticks[underlying]
+        if underlying + '.close' not in arrays:
+            arrays[underlying + '.close'] = np.concatenate([_close(train), _close(test)])
+            arrays[underlying + '.datetime'] = _datetimes(test)
+
+        leg_ticks = ticks.get(symbol, pd.DataFrame())
+        arrays[symbol + '.close'] = _close(leg_ticks)
+        arrays[symbol + '.datetime'] = _datetimes(leg_ticks)
+        leg_train = initial_data.get(symbol, pd.DataFrame())
+
+        # training history alone gets evaluated if any underlying ticks before this one does
+        from_initial = first_underlying is not None and first_underlying != underlying
+
+        plans.append({
+            'symbol': symbol,
+            'underlying': underlying,
+            'n_train': len(train),
+            'n_test': len(test),
+            'tz': test['datetime'].dt.tz if len(test) else None,
+            'from_initial': from_initial,
+            # merge ranks of this leg and of the underlyings whose ticks can sell it
+            'rank': order.get(symbol, len(order)),
+            'underlying_rank': order[underlying],
+            'first_rank': first_rank,
+            'first_ns': first_ns,
+            'first_datetime': _datetime(ticks[first_underlying], 0) if first_underlying else None,
+            'train_close': leg_train['close'].iloc[-1] if len(leg_train) else np.nan,
+        })
+
+    return arrays, plans
+
+
+def evaluate_leg(plan, arrays, generators=VECTORIZED_GENERATORS, cache=None):
+    # fill for one leg, or None if its underlying never fires. cache shares conditions between legs
+    underlying = plan['underlying']
+    if cache is not None and underlying in cache:
+        conditions = cache[underlying]
+    else:
+        conditions = compute_conditions(arrays[underlying + '.close'], generators)
+        if cache is not None:
+            cache[underlying] = conditions
+
+    k, reasons = first_fire(conditions, plan['n_train'], plan['n_test'], plan['from_initial'])
+    if k is None:
+        return None
+
+    # the replay event that evaluated history length k: (datetime, rank, row) of its tick
+    if k == 0:
+        ns, rank, row = plan['first_ns'], plan['first_rank'], 0
+        sold_at = plan['first_datetime']
+    else:
+        datetimes = arrays[underlying + '.datetime']
+        ns, rank, row = datetimes[k - 1:k].view('i8')[0], plan['underlying_rank'], k - 1
+        sold_at = pd.Timestamp(datetimes[k - 1])
+        sold_at = sold_at.tz_localize('UTC').tz_convert(plan['tz']) if plan['tz'] is not None else sold_at
+
+    # leg ticks merged at or before that tick, it is the leg's own for stock positions
+    leg_close = arrays[plan['symbol'] + '.close']
+    if rank == plan['rank']:
+        seen = row + 1
+    else:
+        leg_ns = arrays[plan['symbol'] + '.datetime'].view('i8')
+        seen = int(np.searchsorted(leg_ns, ns, side='right' if plan['rank'] < rank else 'left'))
+    seen = min(seen, len(leg_close))
+    price = leg_close[seen - 1] if seen > 0 else plan['train_close']
+    return {'price': price, 'datetime': sold_at, 'reasons': reasons}
+
+
+def run_vectorized(positions, initial_data, ticks, generators=VECTORIZED_GENERATORS):
+    arrays, plans = plan_positions(positions, initial_data, ticks)
+
+    fills, cache = {}, {}
+    for plan in plans:
+        fill = evaluate_leg(plan, arrays, generators, cache)
+        if fill is not None:
+            fills[plan['symbol']] = fill
+
+    return build_results(positions, fills)
+
+
+def begin_ticks(trader, ticks):
+    # ticks: symbol -> DataFrame or any tick_merge source
+    for tick in merge_ticks(ticks):
+        trader.client.mark(tick)
+        for option_symbol, conditions in trader.receive_tick(tick, not is_option(tick['symbol'])):
+            trader.client.fills[option_symbol]['reasons'] = sorted(conditions.keys())
+
+    print('-- FINAL SYMBOLS -- ')
+    trader.print_symbols()
+
+
+def replay(positions, initial_data, ticks, generators=GENERATORS, feature_store=None):
+    client = MockClient(positions=positions)
+    trader = Trader(client=client, initial_data=initial_data, generators=generators, feature_store=feature_store)
+    for symbol, data in initial_data.items():
+        # seed the last known price so legs sold before their first test tick still get a fill
+        if symbol in trader.symbols and len(data):
+            client.last_prices[symbol] = data['close'].iloc[-1]
+    begin_ticks(trader, ticks)
+    trader.save_features()
+    return build_results(positions, client.fills)
@@ -0,0 +1,192 @@
+"""
+Streaming OHLCV bars
+
+History comes as TD minute bars and Robinhood 5 minute option bars, live data as level one
+quotes. BarAggregator turns ticks (see stream.QuoteConverter) into 1m / 5m / 15m / daily bars per
+symbol, all at once and one tick at a time:
+
+- every timeframe has a partial bar, updated in place by each tick
+- a tick in a later bucket closes the partial bar, appending it to that timeframe's closed bars
+  (a TickStore, the same shape generators already take) and calling the timeframe's subscribers
+- seed() stitches history on: its bars are resampled to each timeframe and the last one stays
+  the partial bar, since history fetched mid-bar ends on an incomplete bar
+
+    bars = BarAggregator()
+    bars.seed('AMD', minute_history, '1m')
+    bars.subscribe('5m', lambda symbol, bar: ...)
+    bars.update(tick)
+    bars.frame('AMD', '5m')  # closed bars plus the partial one
+"""
+import collections
+
+import pandas as pd
+
+from tick_store import TickStore
+
+MINUTE = 60 * 10 ** 9
+
+# timeframe -> bar length in ns, None for daily (calendar days in the aggregator's tz)
+TIMEFRAMES = collections.OrderedDict([
+    ('1m', MINUTE),
+    ('5m', 5 * MINUTE),
+    ('15m', 15 * MINUTE),
+    ('1d', None),
+])
+
+RESAMPLE_RULES = {'1m': '1min', '5m': '5min', '15m': '15min', '1d': '1D'}
+
+
+def _value(tick, field, default):
+    value = tick.get(field)
+    return default if value is None or value != value else value
+
+
+class Bar:
+    __slots__ = ('start', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, start, open, high, low, close, volume):
+        self.start = start  # bucket start, ns UTC
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def update(self, high, low, close, volume):
+        if high > self.high:
+            self.high = high
+        if low < self.low:
+            self.low = low
+        self.close = close
+        self.volume += volume
+
+    def row(self, tz):
+        return {
+            'datetime': pd.Timestamp(self.start, tz='UTC').tz_convert(tz),
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'volume': self.volume,
+        }
+
+
+class BarAggregator:
+    def __init__(self, timeframes=tuple(TIMEFRAMES), tz='EST', max_history=None):
+        self.timeframes = list(timeframes)
+        self.tz = tz
+        self.max_history = max_history
+        self.closed = {}   # (symbol, timeframe) -> TickStore of closed bars
+        self.partial = {}  # (symbol, timeframe) -> Bar
+        self.closed_until = {}  # (symbol, timeframe) -> start of the last bar closed by advance()
+        self.subscribers = collections.defaultdict(list)
+        self._day = (0, 0)  # ns bounds of the last day bucketed
+
+    def bucket(self, timeframe, ts):
+        # start of the bar holding ts (a tz-aware Timestamp), ns UTC
+        length = TIMEFRAMES[timeframe]
+        if length is not None:
+            return ts.value - ts.value % length
+
+        # local midnight takes a tz conversion, so remember the current day's bounds
+        start, end = self._day
+        if not start <= ts.value < end:
+            day = ts.tz_convert(self.tz).normalize()
+            start, end = day.value, (day + pd.Timedelta(days=1)).normalize().value
+            self._day = (start, end)
+        return start
+
+    def subscribe(self, timeframe, callback):
+        # callback(symbol, bar row) on every bar of timeframe that closes
+        self.subscribers[timeframe].append(callback)
+
+    def bars(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        if key not in self.closed:
+            self.closed[key] = TickStore(max_history=self.max_history, tz=self.tz)
+        return self.closed[key]
+
+    def _close(self, symbol, timeframe, bar):
+        row = bar.row(self.tz)
+        self.bars(symbol, timeframe).append(row)
+        for callback in self.subscribers[timeframe]:
+            callback(symbol, row)
+        return row
+
+    def seed(self, symbol, history, timeframe='1m'):
+        """
+        Historical bars of timeframe (a DataFrame with datetime and OHLCV) for symbol. Every
+        timeframe at least as long is rebuilt from them. Call before any live tick.
+        """
+        if len(history) == 0:
+            return
+        history = history.set_index(pd.DatetimeIndex(history['datetime']).tz_convert(self.tz))
+        base = list(TIMEFRAMES).index(timeframe)
+        for name in self.timeframes:
+            if list(TIMEFRAMES).index(name) < base:
+                continue
+            resampled = history.resample(RESAMPLE_RULES[name], label='left', closed='left').agg(
+                {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).dropna(
+                subset=['close'])
+            if len(resampled) == 0:
+                continue
+            resampled = resampled.rename_axis('datetime').reset_index()
+            self.bars(symbol, name).extend(resampled.iloc[:-1])
+            last = resampled.iloc[-1]
+            self.partial[(symbol, name)] = Bar(self.bucket(name, last['datetime']), last['open'], last['high'],
+                                               last['low'], last['close'], last['volume'])
+
+    def update(self, tick):
+        """
+        tick: symbol, datetime and close (open / high / low / volume used when present). Returns
+        [(timeframe, bar row)] for the bars it closed.
+        """
+        symbol, close = tick['symbol'], tick['close']
+        if close is None or close != close:
+            return []
+        ts = pd.Timestamp(tick['datetime'])
+        if ts.tz is None:
+            ts = ts.tz_localize('UTC')
+        high = _value(tick, 'high', close)
+        low = _value(tick, 'low', close)
+        volume = _value(tick, 'volume', 0.)
+
+        closed = []
+        for timeframe in self.timeframes:
+            key = (symbol, timeframe)
+            start = self.bucket(timeframe, ts)
+            bar = self.partial.get(key)
+            if bar is None and start <= self.closed_until.get(key, start - 1):
+                # the bar was closed (and published) by advance(), a late tick is dropped
+                continue
+            if bar is not None and start <= bar.start:
+                # late ticks count towards the open bar rather than reopening a closed one
+                bar.update(high, low, close, volume)
+                continue
+            if bar is not None:
+                closed.append((timeframe, self._close(symbol, timeframe, bar)))
+            self.partial[key] = Bar(start, _value(tick, 'open', close), high, low, close, volume)
+        return closed
+
+    def advance(self, now):
+        # closes every partial bar whose bucket ended before now (e.g. from a scheduler when quotes stop)
+        now = pd.Timestamp(now)
+        closed = []
+        for (symbol, timeframe), bar in list(self.partial.items()):
+            if self.bucket(timeframe, now) > bar.start:
+                closed.append((symbol, timeframe, self._close(symbol, timeframe, bar)))
+                del self.partial[(symbol, timeframe)]
+                self.closed_until[(symbol, timeframe)] = bar.start
+        return closed
+
+    def frame(self, symbol, timeframe, include_partial=True):
+        df = self.bars(symbol, timeframe).frame()
+        bar = self.partial.get((symbol, timeframe))
+        if include_partial and bar is not None:
+            df = pd.concat([df, pd.DataFrame([bar.row(self.tz)])], ignore_index=True)
+        return df
+
+    def last(self, symbol, timeframe):
+        # the partial bar's row, None if there is none
+        bar = self.partial.get((symbol, timeframe))
+        return None if bar is None else bar.row(self.tz)
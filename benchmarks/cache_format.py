@@ -0,0 +1,48 @@
+"""
+Load time of cached history: CSV (what RobinFetcher used to write) vs the columnar .col format.
+
+    python -m benchmarks.cache_format [rows ...]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+import pandas as pd
+
+from columnar import read_frame, write_frame
+from history_cache import HistoryCache
+from benchmarks.synthetic import synthetic_history
+
+
+def best_of(fn, repeat=5):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def run(sizes=(1000, 10000, 100000)):
+    cache = HistoryCache(tempfile.gettempdir(), lambda key: key)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            df = synthetic_history(size)
+            csv_path, col_path = os.path.join(tmp, 'h.csv'), os.path.join(tmp, 'h.col')
+            df.to_csv(csv_path)
+            write_frame(df, col_path)
+
+            rows.append({
+                'rows': size,
+                'csv_mb': os.path.getsize(csv_path) / 1e6,
+                'col_mb': os.path.getsize(col_path) / 1e6,
+                'csv_load_ms': best_of(lambda: cache.read_legacy(csv_path)) * 1e3,
+                'col_load_ms': best_of(lambda: read_frame(col_path, mmap=False)) * 1e3,
+                'col_mmap_ms': best_of(lambda: read_frame(col_path)) * 1e3,
+            })
+
+    results = pd.DataFrame.from_records(rows)
+    results['speedup'] = results['csv_load_ms'] / results['col_mmap_ms']
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or (1000, 10000, 100000)
+    print(run(sizes).to_markdown(index=False, floatfmt='.4g'))
@@ -0,0 +1,84 @@
+"""
+Synthetic market data
+
+Random walk OHLCV for a set of underlyings, with option legs on them priced off the underlying
+(intrinsic value plus time value decaying to expiry), laid out the way tester.get_test_data
+returns real data: positions, initial (train) data and ticks (test) keyed by symbol.
+"""
+import numpy as np
+import pandas as pd
+
+
+def synthetic_history(rows, seed=0, start='2020-01-02 09:30', freq='5min', price=None):
+    rng = np.random.default_rng(seed)
+    if price is None:
+        close = np.abs(np.cumsum(rng.normal(size=rows))) + 1.
+    else:
+        close = price * np.exp(np.cumsum(rng.normal(scale=0.002, size=rows)))
+    return pd.DataFrame({
+        'datetime': pd.date_range(start, periods=rows, freq=freq, tz='EST'),
+        'open': close + rng.normal(scale=.1, size=rows),
+        'high': close + .2,
+        'low': close - .2,
+        'close': close,
+        'volume': rng.integers(0, 10000, size=rows).astype(float),
+    })
+
+
+def option_history(underlying, strike, option_type='call', seed=0):
+    # prices a leg off its underlying's closes, time value shrinking linearly to zero at the last bar
+    rng = np.random.default_rng(seed)
+    spot = underlying['close'].to_numpy()
+    intrinsic = np.maximum(spot - strike, 0) if option_type == 'call' else np.maximum(strike - spot, 0)
+    time_value = spot * 0.05 * np.linspace(1, 0, len(spot)) * np.exp(-abs(spot - strike) / spot)
+    close = np.maximum(intrinsic + time_value + rng.normal(scale=0.01, size=len(spot)), 0.01)
+    return pd.DataFrame({
+        'datetime': underlying['datetime'].reset_index(drop=True),
+        'open': close,
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'close': close,
+        'volume': rng.integers(0, 500, size=len(spot)).astype(float),
+    })
+
+
+def option_symbol(underlying, exp, strike, option_type):
+    return '{}_{}{}{:g}'.format(underlying, exp.strftime('%m%d%y'), option_type[0].upper(), strike)
+
+
+def synthetic_market(n_symbols=10, n_bars=500, legs_per_symbol=1, train_fraction=0.8, seed=0):
+    """
+    n_symbols underlyings with n_bars bars each and legs_per_symbol call positions on each.
+    Returns (positions, initial_data, ticks).
+    """
+    rng = np.random.default_rng(seed)
+    n_train = int(n_bars * train_fraction)
+
+    positions, initial_data, ticks = [], {}, {}
+    for i in range(n_symbols):
+        underlying = 'SYM{}'.format(i)
+        history = synthetic_history(n_bars, seed=seed * 7919 + i, price=float(rng.uniform(20, 500)))
+        initial_data[underlying] = history.iloc[:n_train].reset_index(drop=True)
+        ticks[underlying] = history.iloc[n_train:].reset_index(drop=True).assign(symbol=underlying)
+
+        exp = history['datetime'].iloc[-1] + pd.Timedelta(days=1)
+        spot = history['close'].iloc[n_train]
+        for k in range(legs_per_symbol):
+            strike = round(spot * (1 + 0.05 * k))
+            symbol = option_symbol(underlying, exp, strike, 'call')
+            option = option_history(history, strike, seed=seed * 7919 + i * 31 + k)
+            initial_data[symbol] = option.iloc[:n_train].reset_index(drop=True)
+            ticks[symbol] = option.iloc[n_train:].reset_index(drop=True).assign(symbol=symbol)
+            positions.append({
+                'symbol': symbol,
+                'underlyingSymbol': underlying,
+                'putCall': 'CALL',
+                'strike': float(strike),
+                'optionExpirationDate': exp,
+                'longQuantity': 1.,
+                'shortQuantity': 0.,
+                'averagePrice': float(option['close'].iloc[n_train - 1]),
+                'settlementDate': history['datetime'].iloc[n_train].strftime('%Y-%m-%d'),
+            })
+
+    return pd.DataFrame.from_records(positions), initial_data, ticks
@@ -0,0 +1,218 @@
+"""
+Offline trading loop benchmarks
+
+Runs Trader against a MockClient on synthetic data (see synthetic.py), no broker needed:
+
+- tick_rate         ticks/s through Trader.receive_tick, signals only so every symbol stays live
+- memory_per_symbol bytes allocated per symbol to build a Trader on its initial data
+- refresh_portfolio seconds per Trader.refresh_portfolio
+- backtest_*        wall time of the vectorized backtest and the tick replay
+- implied_vol_chain seconds to solve IV and greeks for a chain of --strikes calls over a year of
+                    5 minute bars
+
+Each run is a list of records {benchmark, symbols, bars, legs, value, unit, ...}. --save appends
+them to a JSON lines file, --compare checks them against the latest saved run with the same
+parameters and exits non-zero on a regression beyond --tolerance.
+
+    python -m benchmarks.trading --symbols 10 100 --bars 500 --save
+    python -m benchmarks.trading --symbols 10 100 --bars 500 --compare benchmarks/results.jsonl
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backtest import replay, run_vectorized
+from benchmarks.synthetic import synthetic_market
+from mock_broker import MockClient
+from seller import Trader, GENERATORS
+from symbols import is_option
+from volatility import black_scholes, greeks, implied_volatility
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+# signals are computed but nothing sells, so the watchlist stays the same size throughout
+HOLD_GENERATORS = {
+    'signals': GENERATORS['signals'],
+    'conditions': []
+}
+
+HIGHER_IS_BETTER = {'tick_rate'}
+
+
+def quiet():
+    # Trader prints its symbols and positions, keep that out of the results
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def best_of(fn, repeat=3):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def make_trader(positions, initial_data, generators=HOLD_GENERATORS):
+    with quiet():
+        return Trader(MockClient(positions.copy()), initial_data, generators=generators)
+
+
+def tick_rate(positions, initial_data, ticks):
+    trader = make_trader(positions, initial_data)
+    # rows as dicts up front so DataFrame.iloc isn't what gets measured
+    rows = [tick for df in ticks.values() for tick in df.to_dict(orient='records')]
+    rows.sort(key=lambda tick: tick['datetime'])
+
+    start = time.perf_counter()
+    with quiet():
+        for tick in rows:
+            trader.receive_tick(tick, not is_option(tick['symbol']))
+    return len(rows) / (time.perf_counter() - start)
+
+
+def memory_per_symbol(positions, initial_data):
+    tracemalloc.start()
+    try:
+        trader = make_trader(positions, initial_data)
+        with quiet():
+            trader.evaluate()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size / max(len(trader.symbols), 1)
+
+
+def refresh_portfolio(positions, initial_data):
+    trader = make_trader(positions, initial_data)
+
+    def refresh():
+        with quiet():
+            trader.refresh_portfolio()
+
+    return best_of(refresh, repeat=20)
+
+
+def implied_vol_chain(strikes=50, bars=252 * 78, seed=0):
+    rng = np.random.default_rng(seed)
+    spot = 100 * np.exp(np.cumsum(rng.normal(scale=0.002, size=bars)))[None, :]
+    strike = np.linspace(50, 150, strikes)[:, None]
+    t = np.linspace(1, 1 / 365, bars)[None, :]
+    prices = np.round(black_scholes(spot, strike, t, rng.uniform(0.2, 0.6, (strikes, 1))), 2)
+
+    def solve():
+        greeks(spot, strike, t, implied_volatility(prices, spot, strike, t))
+
+    return best_of(solve)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(symbols=(10, 100), bars=500, legs=1, seed=0, strikes=50):
+    context = {'commit': git_commit(), 'time': time.time(), 'python': platform.python_version()}
+    records = []
+
+    def record(benchmark, n_symbols, value, unit):
+        records.append(dict(benchmark=benchmark, symbols=n_symbols, bars=bars, legs=legs, value=value, unit=unit,
+                            **context))
+
+    for n_symbols in symbols:
+        positions, initial_data, ticks = synthetic_market(n_symbols, bars, legs, seed=seed)
+
+        record('tick_rate', n_symbols, tick_rate(positions, initial_data, ticks), 'ticks/s')
+        record('memory_per_symbol', n_symbols, memory_per_symbol(positions, initial_data), 'bytes')
+        record('refresh_portfolio', n_symbols, refresh_portfolio(positions, initial_data), 's')
+        record('backtest_vectorized', n_symbols,
+               best_of(lambda: run_vectorized(positions, initial_data, ticks), repeat=5), 's')
+        with quiet():
+            record('backtest_replay', n_symbols,
+                   best_of(lambda: replay(positions, initial_data, ticks), repeat=1), 's')
+
+    if strikes:
+        records.append(dict(benchmark='implied_vol_chain', symbols=strikes, bars=252 * 78, legs=strikes,
+                            value=implied_vol_chain(strikes, seed=seed), unit='s', **context))
+    return records
+
+
+def key(record):
+    return record['benchmark'], record['symbols'], record['bars'], record['legs']
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save(records, path=RESULTS):
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def compare(records, baseline, tolerance=0.2):
+    # records vs the latest baseline record with the same key, change > 0 is worse
+    latest = {}
+    for record in baseline:
+        latest[key(record)] = record
+
+    rows = []
+    for record in records:
+        previous = latest.get(key(record))
+        if previous is None or not previous['value']:
+            continue
+        ratio = record['value'] / previous['value']
+        change = 1 / ratio - 1 if record['benchmark'] in HIGHER_IS_BETTER else ratio - 1
+        rows.append({
+            'benchmark': record['benchmark'],
+            'symbols': record['symbols'],
+            'baseline': previous['value'],
+            'baseline_commit': previous.get('commit'),
+            'value': record['value'],
+            'unit': record['unit'],
+            'change': change,
+            'regression': change > tolerance,
+        })
+    return pd.DataFrame.from_records(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--bars', type=int, default=500)
+    parser.add_argument('--legs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strikes', type=int, default=50, help='chain size for implied_vol_chain, 0 skips it')
+    parser.add_argument('--save', nargs='?', const=RESULTS, default=None, metavar='FILE')
+    parser.add_argument('--compare', default=None, metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    records = run(args.symbols, args.bars, args.legs, args.seed, args.strikes)
+    table = pd.DataFrame.from_records(records)[['benchmark', 'symbols', 'bars', 'legs', 'value', 'unit']]
+    print(table.to_markdown(index=False, floatfmt='.4g'))
+
+    status = 0
+    if args.compare:
+        comparison = compare(records, load(args.compare), args.tolerance)
+        if len(comparison):
+            print(comparison.to_markdown(index=False, floatfmt='.4g'))
+            status = int(comparison['regression'].any())
+    if args.save:
+        save(records, args.save)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
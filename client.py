@@ -1,10 +1,14 @@
-import tdameritrade as td
 import pandas as pd
 import os
 import json
 
 from data_fetcher import TDFetcher, RobinFetcher
 from seller import Trader
+from loader import HistoryLoader, stock_request, option_request
+from transaction_store import TransactionStore
+from lots import LotIndex
+from symbols import contract, is_option
+from feature_store import FeatureStore
 
 pd.set_option('mode.chained_assignment', None)
 
@@ -15,12 +19,22 @@ class TdAccount:
         self.refresh_token = os.getenv('TDAMERITRADE_REFRESH_TOKEN')
         self.account_id = os.getenv('TDAMERITRADE_ACCOUNT_ID')
         self.redirect_url = 'http://localhost:8080'
-        self.client = td.TDClient(client_id=self.client_id, refresh_token=self.refresh_token, account_ids=[self.account_id])
+        self._client = None
         self.portfolio = None
         self._working_trans_df = None
-        self._initial_trans_df = None
+        self.transaction_store = TransactionStore('./cache/td/transactions_{}.pkl'.format(self.account_id))
+
+    @property
+    def client(self):
+        # tdameritrade is imported and the session built on first use
+        if self._client is None:
+            import tdameritrade as td
+            self._client = td.TDClient(client_id=self.client_id, refresh_token=self.refresh_token,
+                                       account_ids=[self.account_id])
+        return self._client
 
     def auth(self):
+        import tdameritrade as td
         print(td.auth.authentication(self.client_id, self.redirect_url))
 
     def get_account(self):
@@ -31,27 +45,6 @@ class TdAccount:
 
         transactions_df = self.get_transactions(refresh=True)
 
-        def find_in_transactions(position):
-            symbol = position['symbol']
-            amount = position['longQuantity'] if position['longQuantity'] is not 0 else position['shortQuantity']
-            cost = amount * position['averagePrice'] * 100
-            trans = transactions_df[
-                (transactions_df['symbol'] == symbol) & (transactions_df['tradeType'] == 'BUY TRADE')]
-            ans, i = None, 0
-            while amount > 0 and cost > 0 and i < len(trans):
-                curr_trans = trans.iloc[i]
-                amount -= curr_trans['amount']
-                cost += curr_trans['cost']
-
-                if ans is None:
-                    ans = curr_trans
-                else:
-                    ans['netAmount'] += curr_trans['netAmount']
-
-                i -= 1
-
-            return ans
-
         def clean(positions_df):
             df1 = pd.json_normalize(positions_df['instrument'])
 
@@ -69,22 +62,14 @@ class TdAccount:
                 columns=['settledLongQuantity', 'settledShortQuantity', 'instrument', 'maintenanceRequirement', 'cusip',
                          'type'], inplace=True)
 
-            position_transactions = [None] * len(positions_df)
-            transaction_keys = ['settlementDate', 'transactionDate', 'transactionId', 'netAmount', 'optionExpirationDate']
-
-            for idx, row in positions_df.iterrows():
-                transaction = find_in_transactions(row)
-                if transaction is not None:
-                    position_transactions[idx] = {key: transaction[key] for key in list(transaction.keys()) if
-                                                  key in transaction_keys}
-                else:
-                    position_transactions[idx] = {key: None for key in transaction_keys}
+            # cost basis, open date and expiration of each position's open FIFO lots
+            position_transactions = LotIndex(transactions_df).match_positions(positions_df)
 
-                if '_' in row['symbol']:
-                    position_transactions[idx]['strike'] = float(row['description'].split(" ")[-2])
+            options = positions_df['symbol'].map(is_option).astype(bool)
+            position_transactions.loc[options, 'strike'] = positions_df.loc[options, 'symbol'].map(
+                lambda symbol: contract(symbol).strike)
 
-            positions_df = positions_df.merge(pd.DataFrame.from_records(position_transactions), how='outer',
-                                              left_index=True, right_index=True)
+            positions_df = positions_df.merge(position_transactions, how='outer', left_index=True, right_index=True)
             positions_df['optionExpirationDate'] = positions_df['optionExpirationDate'].astype('datetime64').dt.tz_localize('EST')
 
             return positions_df
@@ -103,50 +88,46 @@ class TdAccount:
 
         return [build_symbol(position) for position in self.portfolio]
 
+    def get_option_tickers(self):
+        # option legs held, streamed for their quotes (see TDFetcher.start_stream)
+        if not self.portfolio:
+            self.get_active_positions()
+        return list(dict.fromkeys(position['symbol'] for position in self.portfolio if is_option(position['symbol'])))
+
     def get_transactions(self, refresh=False):
         if self._working_trans_df is not None and not refresh:
             return self._working_trans_df
 
-        if self._initial_trans_df is None or refresh:
-            self._initial_trans_df = pd.DataFrame(data=self.client.transactions(type='ALL')[self.account_id])
+        def fetch(start_date):
+            return self.client.transactions(type='ALL', startDate=start_date)[self.account_id]
 
-        working_trans_df = self._initial_trans_df.copy()
-        df2 = pd.json_normalize(working_trans_df['transactionItem'])
-        df2.drop(columns=['accountId', 'instrument.cusip', 'instrument.assetType', 'instrument.type'], inplace=True)
+        self._working_trans_df = self.transaction_store.sync(fetch)
 
-        for col in df2.columns:
-            if 'instrument.' in col:
-                name = col.split('.')[1]
-                df2[name] = df2[col]
-                df2.drop(columns=[col], inplace=True)
+        return self._working_trans_df
 
-        working_trans_df = working_trans_df[working_trans_df['type'] == 'TRADE']
-        working_trans_df['tradeType'] = working_trans_df['description']
-        working_trans_df.drop(
-            columns=['type', 'description', 'cashBalanceEffectFlag', 'fees', 'clearingReferenceNumber', 'achStatus',
-                     'transactionItem', 'subAccount'], inplace=True)
-        working_trans_df = working_trans_df.merge(df2, how='outer', left_index=True, right_index=True)
+    def sell_position(self, position, limit_price=None):
+        # limit_price None is a market order
+        pass
 
-        self._working_trans_df = working_trans_df
 
-        return working_trans_df
+def make_loader(client):
+    return HistoryLoader({'td': TDFetcher(client), 'rh': RobinFetcher()})
 
-    def sell_position(self, position):
-        pass
 
-
-def get_initial_data(client):
-    initial_data = {}
+def get_initial_data(client, loader):
+    requests = {}
     for idx, position in client.get_active_positions().iterrows():
-        if '_' in position['symbol']:
+        if is_option(position['symbol']):
             underlying_symbol = position['underlyingSymbol']
             option_symbol = position['symbol']
             exp = position['optionExpirationDate'].strftime('%Y-%m-%d')
-            initial_data[underlying_symbol] = td_fetcher.get_historical_stock(underlying_symbol)
-            initial_data[option_symbol] = rh_fetcher.get_historical_options(
+            requests[underlying_symbol] = stock_request(underlying_symbol)
+            requests[option_symbol] = option_request(
                 underlying_symbol, exp=exp, strike=position['strike'], option_type=position['putCall'].lower())
         else:
-            initial_data[position['symbol']] = td_fetcher.get_historical_stock(position['symbol'])
+            requests[position['symbol']] = stock_request(position['symbol'])
+
+    initial_data = loader.load(requests)
 
     print('--- INITIAL DATA -- ', initial_data)
     return initial_data
@@ -155,16 +136,20 @@ def get_initial_data(client):
 def receive_stream_msg(msg):
     print(json.dumps(msg, indent=4))
 
-client = TdAccount()
 
-print(client.get_active_positions())
+def main():
+    client = TdAccount()
+
+    print(client.get_active_positions())
 
-td_fetcher = TDFetcher(client)
-rh_fetcher = RobinFetcher()
+    loader = make_loader(client)
+    init_data = get_initial_data(client, loader)
 
-init_data = get_initial_data(client)
+    seller = Trader(client, init_data, feature_store=FeatureStore('./cache/features/'))
 
-seller = Trader(client)
+    # loader.fetchers['td'].start_stream(receive_stream_msg)
+    return seller
 
-# td_fetcher.start_stream(receive_stream_msg)
 
+if __name__ == '__main__':
+    main()
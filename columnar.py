@@ -0,0 +1,134 @@
+"""
+Columnar binary frame format (.col)
+
+Caching history as CSV meant parsing text and timestamps on every load. A .col file stores each
+column as raw little-endian values so it can be memory-mapped back without parsing or copying:
+
+    b'PMCOL1\\n' | uint64 header length | JSON header | padding | column 0 | column 1 | ...
+
+The header lists every column's name, dtype, byte offset and, for datetimes, the time zone.
+Datetimes are stored as int64 nanoseconds since the epoch (UTC) and come back tz-aware in the
+zone they were written with. An index other than the default RangeIndex is stored the same way as
+a column named __index__. Numeric columns keep their dtype. Anything else (strings) is
+stored inline in the header, which is fine for the odd label column but not meant for bulk text.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from tick_store import to_utc_ns
+
+MAGIC = b'PMCOL1\n'
+ALIGNMENT = 64
+INDEX_COLUMN = '__index__'
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _encode_column(name, series, columns, arrays, inline):
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values, tz = to_utc_ns(series)
+        columns.append({'name': name, 'dtype': '<i8', 'datetime': True, 'tz': str(tz) if tz else None})
+        arrays.append(values.view('<i8'))
+    elif pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_numeric_dtype(series.dtype):
+        values = series.to_numpy()
+        values = values.astype(values.dtype.newbyteorder('<'), copy=False)
+        columns.append({'name': name, 'dtype': values.dtype.str})
+        arrays.append(values)
+    else:
+        inline[name] = [None if pd.isnull(value) else str(value) for value in series]
+        columns.append({'name': name, 'inline': True})
+
+
+def _encode(df):
+    columns, arrays, inline = [], [], {}
+
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        _encode_column(INDEX_COLUMN, df.index, columns, arrays, inline)
+        columns[-1]['label'] = df.index.name
+
+    for name in df.columns:
+        _encode_column(name, df[name], columns, arrays, inline)
+
+    return columns, arrays, inline
+
+
+def write_frame(df, path):
+    columns, arrays, inline = _encode(df)
+
+    # offsets depend on the header length, which depends on the offsets, so lay out twice
+    header = {'rows': len(df), 'columns': columns, 'inline': inline}
+    for _ in range(2):
+        offset = _align(len(MAGIC) + 8 + len(json.dumps(header).encode()))
+        for column, values in zip([c for c in columns if not c.get('inline')], arrays):
+            column['offset'] = offset
+            offset = _align(offset + values.nbytes)
+    raw = json.dumps(header).encode()
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(raw)))
+        f.write(raw)
+        for column, values in zip([c for c in columns if not c.get('inline')], arrays):
+            f.write(b'\0' * (column['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(values).tobytes())
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a columnar frame'.format(path))
+        length, = struct.unpack('<Q', f.read(8))
+        return json.loads(f.read(length))
+
+
+def read_columns(path, mmap=True):
+    """
+    name -> ndarray. With mmap the arrays are read-only views of the file, nothing is copied.
+    Datetime columns come back as datetime64[ns] (UTC), see read_frame for tz-aware ones.
+    """
+    header = read_header(path)
+    rows, arrays = header['rows'], {}
+    for column in header['columns']:
+        if column.get('inline'):
+            arrays[column['name']] = np.array(header['inline'][column['name']], dtype=object)
+            continue
+        dtype = np.dtype(column['dtype'])
+        if rows == 0:
+            values = np.empty(0, dtype=dtype)
+        elif mmap:
+            values = np.memmap(path, dtype=dtype, mode='r', offset=column['offset'], shape=(rows,)).view(np.ndarray)
+        else:
+            with open(path, 'rb') as f:
+                f.seek(column['offset'])
+                values = np.fromfile(f, dtype=dtype, count=rows)
+        arrays[column['name']] = values.view('M8[ns]') if column.get('datetime') else values
+    return arrays
+
+
+def read_frame(path, mmap=True):
+    header = read_header(path)
+    arrays = read_columns(path, mmap=mmap)
+
+    data, index = {}, None
+    for column in header['columns']:
+        name = column['name']
+        values = arrays[name]
+        if column.get('datetime'):
+            values = pd.DatetimeIndex(values)
+            if column.get('tz'):
+                values = values.tz_localize('UTC').tz_convert(column['tz'])
+        if name == INDEX_COLUMN:
+            index = pd.Index(values, name=column.get('label'))
+        else:
+            data[name] = values
+
+    return pd.DataFrame(data, index=index, columns=[c['name'] for c in header['columns'] if c['name'] != INDEX_COLUMN],
+                        copy=False)
@@ -1,70 +1,73 @@
-from tda.auth import easy_client
-from tda.streaming import StreamClient
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from datetime import datetime
-
 import os
-import robin_stocks as rh
 import pandas as pd
 import asyncio
+import threading
 
-from utils import get_cached_option_file_name, list_all_files_in_dir
-
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-driver = webdriver.Chrome(options=chrome_options)
-
-LevelOneEquityFields = StreamClient.LevelOneEquityFields
+from utils import option_cache_file_name, parse_cached_option_file_name
+from history_cache import HistoryCache
+from stream import StreamPipeline, consume
+from instrumentation import REGISTRY as metrics
 
+# broker SDKs and selenium are imported where they're used: importing this module opens nothing
+_driver = None
+_driver_lock = threading.Lock()
 
-class RobinFetcher:
-    def __init__(self):
-        self.cache_dir = './cache/rh/'
-
-        email = os.getenv('ROBINHOOD_EMAIL')
-        password = os.getenv('ROBINHOOD_PASSWORD')
 
-        rh.login(email, password)
+def get_driver():
+    # headless Chrome for scraping, started on first use
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
 
-        cached_files = list_all_files_in_dir(self.cache_dir)
+            chrome_options = Options()
+            chrome_options.add_argument("--headless")
+            _driver = webdriver.Chrome(options=chrome_options)
+        return _driver
 
-        self.options_data = dict()
 
-        for file in cached_files:
-            underlying, strike, option_type, exp = file.split('_')
-            exp = exp.split('.')[0]
-            strike = float(strike)
-            self.add_option_to_cache(underlying, exp, strike, option_type='call')
-            self.options_data[underlying][exp][strike][option_type] = pd.read_csv(self.cache_dir + file, index_col=0)
+def robin_stocks():
+    import robin_stocks
+    return robin_stocks
 
-    def add_option_to_cache(self, symbol, exp, strike, option_type='call'):
-        if symbol not in self.options_data:
-            self.options_data[symbol] = dict()
 
-        if exp not in self.options_data[symbol]:
-            self.options_data[symbol][exp] = dict()
+class RobinFetcher:
+    def __init__(self, memory_budget=256 * 1024 * 1024):
+        self.cache_dir = './cache/rh/'
 
-        if strike not in self.options_data[symbol][exp]:
-            self.options_data[symbol][exp][strike] = dict()
+        self.logged_in = False
+        self._login_lock = threading.Lock()  # HistoryLoader fetches from several threads
 
-        if option_type not in self.options_data[symbol][exp][strike]:
-            self.options_data[symbol][exp][strike][option_type] = None
+        # (underlying, exp, strike, type) -> history, read from disk on first access
+        self.options_data = HistoryCache(self.cache_dir, option_cache_file_name,
+                                         parse_file_name=parse_cached_option_file_name,
+                                         memory_budget=memory_budget)
 
-        return self.options_data[symbol][exp][strike][option_type]
+    def login(self):
+        # the Robinhood session is opened by the first fetch, not on construction
+        rh = robin_stocks()
+        with self._login_lock:
+            if not self.logged_in:
+                rh.login(os.getenv('ROBINHOOD_EMAIL'), os.getenv('ROBINHOOD_PASSWORD'))
+                self.logged_in = True
+        return rh
 
     def get_historical_options(self, symbol, exp, strike, option_type='call', interval='5minute', span='week', refresh=False):
-        option = self.add_option_to_cache(symbol, exp, strike, option_type)
+        key = (symbol, exp, float(strike), option_type)
+        option = None if refresh else self.options_data.get(key)
 
-        if refresh or option is None:
-            self.options_data[symbol][exp][strike][option_type] = self.fetch_historical_options(symbol, exp, strike, option_type,
-                                                                                  interval, span)
-            file_name = self.cache_dir + get_cached_option_file_name(symbol, datetime.strptime(exp, "%Y-%m-%d"), strike, option_type)
-            self.options_data[symbol][exp][strike][option_type].to_csv(file_name)
+        if option is None:
+            metrics.count('cache.rh.miss')
+            with metrics.timer('fetch.rh.options'):
+                option = self.fetch_historical_options(symbol, exp, strike, option_type, interval, span)
+            file_name = self.options_data.put(key, option)
 
             print('Cached file, ', file_name)
+        else:
+            metrics.count('cache.rh.hit')
 
-        return self.options_data[symbol][exp][strike][option_type]
+        return option
 
     def _clean(self, df):
         df.dropna(inplace=True)
@@ -82,6 +85,7 @@ class RobinFetcher:
     def fetch_historical_options(self, symbol, exp, strike, option_type='call',
                                interval='day', span='year', bounds='regular'):
         print('-- Fetching Option: {} {} {} {} --'.format(symbol, strike, option_type, exp))
+        rh = self.login()
         historical_data = rh.get_option_historicals(symbol, exp, strike, option_type, interval, span,
                                                     bounds)
         df = pd.DataFrame.from_records(historical_data)
@@ -89,15 +93,24 @@ class RobinFetcher:
 
     def get_historical_stock(self, symbol, interval='day', span='year', bounds='regular'):
         print('-- Fetching Stock: {} --'.format(symbol))
+        rh = self.login()
         historical_data = rh.get_stock_historicals(symbol, interval, span, bounds)
         df = pd.DataFrame.from_records(historical_data)
         return self._clean(df)
 
 
+def stock_cache_file_name(key):
+    return '_'.join(str(part) for part in key) + '.col'
+
+
 class TDFetcher:
-    def __init__(self, client):
+    def __init__(self, client, memory_budget=256 * 1024 * 1024):
         self.client = client
         self.td_client = client.client
+        self.cache_dir = './cache/td/'
+
+        # (symbol, period_type, period, frequency_type, frequency) -> history
+        self.stock_data = HistoryCache(self.cache_dir, stock_cache_file_name, memory_budget=memory_budget)
 
     def _clean(self, df):
         df.dropna(inplace=True)
@@ -108,12 +121,36 @@ class TDFetcher:
     PERIOD_TYPE_VALUES = ('day', 'month', 'year', 'ytd')
     FREQUENCY_TYPE_VALUES = ('minute', 'daily', 'weekly', 'monthly')
     """
-    def get_historical_stock(self, symbol, period_type='day', period=10, frequency_type='minute', frequency=1):
-        print('-- Fetching Stock: {} --'.format(symbol))
-        df = self.td_client.historyDF(symbol, periodType=period_type, period=period, frequencyType=frequency_type, frequency=frequency)
-        return self._clean(df)
+    def get_historical_stock(self, symbol, period_type='day', period=10, frequency_type='minute', frequency=1,
+                             refresh=False, max_age=5 * 60):
+        # history is reused from the cache while it is younger than max_age seconds (None: forever)
+        key = (symbol, period_type, period, frequency_type, frequency)
+        df = None if refresh else self.stock_data.get(key, max_age=max_age)
+
+        if df is None:
+            metrics.count('cache.td.miss')
+            print('-- Fetching Stock: {} --'.format(symbol))
+            with metrics.timer('fetch.td.history'):
+                df = self.td_client.historyDF(symbol, periodType=period_type, period=period, frequencyType=frequency_type, frequency=frequency)
+            df = self._clean(df)
+            self.stock_data.put(key, df)
+        else:
+            metrics.count('cache.td.hit')
+
+        return df
+
+    def start_stream(self, callback, pipeline=None):
+        """
+        callback(msg) is called with every level one message, on the socket's task. With a
+        StreamPipeline (see stream.py) pass its on_message as callback: messages are then evaluated
+        by the pipeline's trader alongside the reader.
+        """
+        from tda.auth import easy_client
+        from tda.streaming import StreamClient
+
+        LevelOneEquityFields = StreamClient.LevelOneEquityFields
+        LevelOneOptionFields = StreamClient.LevelOneOptionFields
 
-    def start_stream(self, callback):
         client = easy_client(
             api_key=self.client.client_id,
             redirect_uri=self.client.redirect_url,
@@ -122,24 +159,40 @@ class TDFetcher:
         stream_client = StreamClient(client, account_id=self.client.account_id)
 
         tickers = self.client.get_portfolio_tickers()
-
-        def order_book_handler(msg):
-            callback(msg)
+        # legs need their own quotes: the order book Trader.sell_price prices their exits off
+        options = self.client.get_option_tickers()
 
         async def read_stream():
             await stream_client.login()
             await stream_client.quality_of_service(StreamClient.QOSLevel.DELAYED)
             await stream_client.level_one_equity_subs(tickers,
                 fields=[LevelOneEquityFields.SYMBOL, LevelOneEquityFields.BID_PRICE, LevelOneEquityFields.ASK_PRICE,
+                        LevelOneEquityFields.LAST_PRICE,
                         LevelOneEquityFields.ASK_SIZE, LevelOneEquityFields.BID_SIZE, LevelOneEquityFields.TOTAL_VOLUME,
-                        LevelOneEquityFields.TRADE_TIME, LevelOneEquityFields.HIGH_PRICE,
-                        LevelOneEquityFields.LOW_PRICE,
+                        LevelOneEquityFields.TRADE_TIME, LevelOneEquityFields.TRADE_TIME_IN_LONG,
+                        LevelOneEquityFields.HIGH_PRICE, LevelOneEquityFields.LOW_PRICE,
                         LevelOneEquityFields.VOLATILITY, LevelOneEquityFields.NET_CHANGE])
-
-
-            stream_client.add_level_one_equity_handler(order_book_handler)
-
-            while True:
-                await stream_client.handle_message()
-
-        asyncio.get_event_loop().run_until_complete(read_stream())
\ No newline at end of file
+            if options:
+                await stream_client.level_one_option_subs(options,
+                    fields=[LevelOneOptionFields.SYMBOL, LevelOneOptionFields.BID_PRICE, LevelOneOptionFields.ASK_PRICE,
+                            LevelOneOptionFields.LAST_PRICE,
+                            LevelOneOptionFields.ASK_SIZE, LevelOneOptionFields.BID_SIZE, LevelOneOptionFields.TOTAL_VOLUME,
+                            LevelOneOptionFields.HIGH_PRICE, LevelOneOptionFields.LOW_PRICE,
+                            LevelOneOptionFields.VOLATILITY, LevelOneOptionFields.NET_CHANGE])
+
+            stream_client.add_level_one_equity_handler(callback)
+            stream_client.add_level_one_option_handler(callback)
+
+            if pipeline is not None:
+                await consume(stream_client, pipeline)
+            else:
+                while True:
+                    await stream_client.handle_message()
+
+        asyncio.get_event_loop().run_until_complete(read_stream())
+
+    def stream_to(self, trader, **pipeline_options):
+        # feed the level one stream into trader, returns the pipeline's StreamMetrics once it closes
+        pipeline = StreamPipeline(trader, **pipeline_options)
+        self.start_stream(pipeline.on_message, pipeline)
+        return pipeline.metrics
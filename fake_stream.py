@@ -0,0 +1,156 @@
+"""
+Local stand-in for the TD level one stream
+
+FakeStreamServer sends random walk quotes over TCP, one JSON message per line, shaped like the
+messages tda-api hands to level one handlers: QUOTE messages for stocks, OPTION messages (wider
+spreads, no TRADE_TIME_IN_LONG) for option symbols. FakeStreamClient has the parts of
+tda.streaming.StreamClient that stream.consume uses, so a StreamPipeline runs against it
+unchanged:
+
+    python fake_stream.py [n_symbols] [n_messages] [evaluation_ms]
+"""
+import asyncio
+import inspect
+import json
+import sys
+import time
+
+import numpy as np
+
+from stream import StreamPipeline, consume
+from symbols import is_option
+
+
+class FakeStreamServer:
+    def __init__(self, symbols, n_messages=10000, quotes_per_message=1, interval=0., seed=0):
+        """
+        interval   seconds between messages, 0 sends as fast as the client reads
+        """
+        self.symbols = list(symbols)
+        self.n_messages = n_messages
+        self.quotes_per_message = quotes_per_message
+        self.interval = interval
+        self.random = np.random.default_rng(seed)
+        self.server = None
+
+    def quotes(self):
+        prices = dict(zip(self.symbols, self.random.uniform(20, 200, len(self.symbols))))
+        volumes = dict.fromkeys(self.symbols, 0)
+        while True:
+            symbol = self.symbols[self.random.integers(len(self.symbols))]
+            prices[symbol] = max(prices[symbol] * (1 + self.random.normal(0, 0.001)), 0.01)
+            volumes[symbol] += int(self.random.integers(1, 500))
+            option = is_option(symbol)
+            spread = round(prices[symbol] * (0.02 if option else 0.0005), 2) or 0.01
+            quote = {
+                'key': symbol,
+                'LAST_PRICE': round(prices[symbol], 2),
+                'BID_PRICE': round(prices[symbol] - spread, 2),
+                'ASK_PRICE': round(prices[symbol] + spread, 2),
+                'BID_SIZE': int(self.random.integers(1, 50)) * (1 if option else 100),
+                'ASK_SIZE': int(self.random.integers(1, 50)) * (1 if option else 100),
+                'TOTAL_VOLUME': volumes[symbol],
+            }
+            if not option:
+                quote['TRADE_TIME_IN_LONG'] = int(time.time() * 1000)
+            yield quote
+
+    async def handle(self, reader, writer):
+        quotes = self.quotes()
+        try:
+            for _ in range(self.n_messages):
+                # one message per service, like the TD stream
+                content = {}
+                for _ in range(self.quotes_per_message):
+                    quote = next(quotes)
+                    content.setdefault('OPTION' if is_option(quote['key']) else 'QUOTE', []).append(quote)
+                for service, service_quotes in content.items():
+                    msg = {
+                        'service': service,
+                        'timestamp': int(time.time() * 1000),
+                        'command': 'SUBS',
+                        'content': service_quotes,
+                    }
+                    writer.write(json.dumps(msg).encode() + b'\n')
+                await writer.drain()
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class FakeStreamClient:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.handlers = {'QUOTE': [], 'OPTION': []}
+
+    async def login(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    def add_level_one_equity_handler(self, handler):
+        self.handlers['QUOTE'].append(handler)
+
+    def add_level_one_option_handler(self, handler):
+        self.handlers['OPTION'].append(handler)
+
+    async def handle_message(self):
+        line = await self.reader.readline()
+        if not line:
+            self.writer.close()
+            raise EOFError('stream closed')
+
+        msg = json.loads(line)
+        for handler in self.handlers.get(msg.get('service'), []):
+            result = handler(msg)
+            if inspect.isawaitable(result):
+                await result
+
+
+class TimedTrader:
+    # takes evaluation_ms per batch, stands in for Trader.receive_ticks
+    def __init__(self, evaluation_ms=0.):
+        self.evaluation_ms = evaluation_ms
+        self.ticks = 0
+
+    def receive_ticks(self, ticks, update=True):
+        self.ticks += len(ticks)
+        if self.evaluation_ms:
+            time.sleep(self.evaluation_ms / 1000)
+        return []
+
+
+async def run(n_symbols=50, n_messages=20000, evaluation_ms=1., **pipeline_options):
+    server = FakeStreamServer(['SYM{}'.format(i) for i in range(n_symbols)], n_messages)
+    host, port = await server.start()
+
+    client = FakeStreamClient(host, port)
+    await client.login()
+    pipeline = StreamPipeline(TimedTrader(evaluation_ms), **pipeline_options)
+    client.add_level_one_equity_handler(pipeline.on_message)
+    client.add_level_one_option_handler(pipeline.on_message)
+
+    start = time.perf_counter()
+    metrics = await consume(client, pipeline)
+    elapsed = time.perf_counter() - start
+    await server.stop()
+
+    summary = metrics.summary()
+    summary['quotes_per_second'] = round(metrics.received / elapsed)
+    return summary
+
+
+if __name__ == '__main__':
+    args = [float(arg) for arg in sys.argv[1:]]
+    n_symbols, n_messages, evaluation_ms = (args + [50, 20000, 1.][len(args):])[:3]
+    print(json.dumps(asyncio.run(run(int(n_symbols), int(n_messages), evaluation_ms)), indent=4))
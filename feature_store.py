@@ -0,0 +1,211 @@
+"""
+Feature store
+
+Every Trader used to recompute its indicators over each symbol's whole training history, although
+that history is mostly the same cached bars from one run to the next. FeatureStore persists the
+streaming engines generators keep (IndicatorEngine, VolumeEngine: running state and output series),
+content addressed by what they were computed from:
+
+    sha1(symbol, engine key, max_history, data version).pkl
+
+The data version is (rows, datetime and close of the last row, checksum) of the history the engine
+had consumed, the checksum being a sha1 of the datetime and close of every consumed row the history
+still holds (all of them unless max_history dropped some). A generator asking for a new engine gets the stored one with the longest history that is
+a prefix of the symbol's current data, and only feeds it the rows appended since. Nothing is
+recomputed when the history hasn't changed, and the outputs are those of an engine that had been
+running all along (VolumeEngine keeps the time of day profile of the history it first saw).
+
+Trader saves its engines as soon as they've consumed the initial data (Trader.warm_up), the version
+the next run over the same history loads. From then on they're written once they've consumed
+min_new_rows rows more than their stored version (Trader calls flush() for the symbols it just
+evaluated and untrack() for the ones it removes, save() writes everything, replay() does at the end). A write adds a version next to the
+older ones, the least recently used files are deleted once the directory is over max_bytes.
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import columns
+
+MANIFEST = 'manifest.json'
+EXT = '.pkl'
+
+
+def _history(data):
+    # (datetime as int64 ns UTC, close, rows ever appended) of a TickStore or DataFrame
+    datetimes, closes = columns(data, ['close'])
+    return datetimes, closes, getattr(data, 'total', len(data))
+
+
+def _rows(data, first, rows):
+    # (datetime, close) of rows first up to rows of data, None if some are gone or not there yet
+    datetimes, closes, total = _history(data)
+    dropped = total - len(closes)
+    if first is None:
+        first = dropped
+    if first < dropped or first >= rows or rows > total:
+        return None
+    return first, datetimes[first - dropped:rows - dropped], closes[first - dropped:rows - dropped]
+
+
+def _checksum(datetimes, closes):
+    checksum = hashlib.sha1(np.ascontiguousarray(datetimes).tobytes())
+    checksum.update(np.ascontiguousarray(closes).tobytes())
+    return checksum.hexdigest()
+
+
+def data_version(data, rows, first=None):
+    # (rows, last datetime, last close, first row checked, checksum) of data's first `rows` rows, the
+    # checksum over rows first.. (by default the oldest still held), None if those rows aren't all there
+    held = _rows(data, first, rows)
+    if held is None:
+        return None
+    first, datetimes, closes = held
+    return rows, int(datetimes[-1]), float(closes[-1]), first, _checksum(datetimes, closes)
+
+
+def _same(a, b):
+    return a == b or a != a and b != b
+
+
+class FeatureStore:
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, min_new_rows=1000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_new_rows = min_new_rows
+        self.hits = 0
+        self.misses = 0
+        self._manifest = None
+        self._changed = False  # manifest differs from the file
+        self._tracked = {}  # id(signals) -> {key: [signals, data, rows stored]}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(symbol, key, data):
+        return [symbol, key, getattr(data, 'max_history', None)]
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + EXT)
+
+    def load(self, symbol, key, data):
+        # the stored engine with the longest history that's a prefix of data, None if there's none
+        with self._lock:
+            manifest = self._load_manifest()
+            stored_key = self._key(symbol, key, data)
+            candidates = sorted(((entry['rows'], digest) for digest, entry in manifest.items()
+                                 if entry['key'] == stored_key), reverse=True)
+            for rows, digest in candidates:
+                entry = manifest[digest]
+                held = _rows(data, entry.get('first', 0), rows)
+                if held is None:
+                    continue
+                _, datetimes, closes = held
+                # the last row first, the checksum goes over all of them
+                if datetimes[-1] != entry['datetime'] or not _same(closes[-1], entry['close']) or \
+                        _checksum(datetimes, closes) != entry.get('checksum'):
+                    continue
+                try:
+                    engine = pd.read_pickle(self.path(digest))
+                except (OSError, EOFError, pickle.UnpicklingError):
+                    self._remove(digest)
+                    continue
+                entry['used'] = time.time()
+                self._changed = True
+                self.hits += 1
+                return engine
+            self.misses += 1
+            return None
+
+    def track(self, signals, key, data):
+        # the engine signals.engines[key] gets written on flush() as it consumes more of data
+        with self._lock:
+            engine = signals.engines.get(key)
+            self._tracked.setdefault(id(signals), {})[key] = [signals, data, getattr(engine, 'seen', 0)]
+
+    def untrack(self, signals):
+        # signals' engines aren't written anymore (their symbol is gone)
+        with self._lock:
+            self._tracked.pop(id(signals), None)
+
+    def flush(self, signals=None, min_new_rows=None):
+        # signals: the Signals whose engines to write, all of the tracked ones by default
+        min_new_rows = self.min_new_rows if min_new_rows is None else min_new_rows
+        with self._lock:
+            if signals is None:
+                tracked_signals = list(self._tracked.values())
+            else:
+                tracked_signals = [self._tracked[id(each)] for each in signals if id(each) in self._tracked]
+            written = 0
+            for engines in tracked_signals:
+                for key, tracked in engines.items():
+                    owner, data, stored = tracked
+                    engine = owner.engines.get(key)
+                    if engine is None or engine.seen - stored < min_new_rows:
+                        continue
+                    version = data_version(data, engine.seen)
+                    if version is None:
+                        continue
+                    self._write(self._key(owner.symbol, key, data), version, engine)
+                    tracked[2] = engine.seen
+                    written += 1
+            if written:
+                self._evict()
+            if self._changed:
+                self._save_manifest()
+            return written
+
+    def save(self):
+        return self.flush(min_new_rows=1)
+
+    def _write(self, stored_key, version, engine):
+        rows, datetime, close, first, checksum = version
+        digest = hashlib.sha1(json.dumps(stored_key + list(version)).encode()).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(digest)
+        tmp = path + '.tmp'
+        pd.to_pickle(engine, tmp)
+        os.replace(tmp, path)
+        self._load_manifest()[digest] = {'key': stored_key, 'rows': rows, 'datetime': datetime, 'close': close,
+                                         'first': first, 'checksum': checksum, 'size': os.path.getsize(path),
+                                         'used': time.time()}
+        self._changed = True
+
+    def _remove(self, digest):
+        self._load_manifest().pop(digest, None)
+        self._changed = True
+        if os.path.isfile(self.path(digest)):
+            os.remove(self.path(digest))
+
+    def _evict(self):
+        # least recently used first, always keeping the newest file
+        manifest = self._load_manifest()
+        used = sum(entry['size'] for entry in manifest.values())
+        for digest in sorted(manifest, key=lambda digest: manifest[digest]['used'])[:-1]:
+            if used <= self.max_bytes:
+                break
+            used -= manifest[digest]['size']
+            self._remove(digest)
+
+    def _load_manifest(self):
+        if self._manifest is None:
+            path = os.path.join(self.directory, MANIFEST)
+            self._manifest = {}
+            if os.path.isfile(path):
+                with open(path) as f:
+                    self._manifest = json.load(f)
+        return self._manifest
+
+    def _save_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, MANIFEST)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._load_manifest(), f)
+        os.replace(tmp, path)
+        self._changed = False
@@ -0,0 +1,60 @@
+"""
+Time indexed history
+
+History wraps a DataFrame sorted by its datetime column, sorting it once if it isn't already, and
+keeps the timestamps as int64 ns UTC. Slicing by date is two binary searches and an iloc, so it
+costs O(log n) and returns views of the frame instead of copies:
+
+    history = History(df)
+    history.slice('2019-01-01', '2021-03-19')      rows in (from, to]
+    train, test = history.split(at='2021-03-19')   rows in (-inf, at] and (at, +inf)
+
+Date boundaries are strings / datetimes, naive ones taken in tz (EST, as TD reports). They're
+parsed once and cached, the same settlement date comes up for every position's histories.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+from tick_store import to_utc_ns
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_boundary(date, tz='EST'):
+    # date -> int64 ns UTC
+    ts = pd.Timestamp(date)
+    if ts.tz is None:
+        ts = ts.tz_localize(tz)
+    return ts.value
+
+
+class History:
+    def __init__(self, df, key='datetime', tz='EST'):
+        self.key = key
+        self.tz = tz
+        ns = to_utc_ns(df[key])[0].view('i8') if len(df) else np.empty(0, dtype=np.int64)
+        if len(ns) > 1 and (np.diff(ns) < 0).any():
+            order = np.argsort(ns, kind='stable')
+            df, ns = df.iloc[order], ns[order]
+        self.frame = df
+        self.ns = ns  # NaT sorts first, so it never falls in a slice with a lower bound
+
+    def __len__(self):
+        return len(self.ns)
+
+    def position(self, date):
+        # number of rows at or before date
+        if date is None:
+            return len(self.ns)
+        return int(np.searchsorted(self.ns, parse_boundary(date, self.tz), side='right'))
+
+    def slice(self, from_date=None, to_date=None):
+        start = 0 if from_date is None else self.position(from_date)
+        return self.frame.iloc[start:max(start, self.position(to_date))]
+
+    def split(self, at, from_date=None):
+        # (train, test) views, the row at `at` goes to train
+        end = self.position(at)
+        start = 0 if from_date is None else min(self.position(from_date), end)
+        return self.frame.iloc[start:end], self.frame.iloc[end:]
@@ -0,0 +1,191 @@
+"""
+On-disk history cache
+
+RobinFetcher used to list its cache directory and read_csv every cached option at startup, so
+startup time and memory grew with every contract ever looked at. HistoryCache instead:
+
+- maps a key, e.g. (underlying, exp, strike, type), straight to its file name, so startup and
+  lookups never scan the directory
+- loads a file only on first access
+- keeps loaded frames in an LRU bounded by memory_budget bytes
+- records every key it writes in a manifest.json index, read only when keys() is asked for
+
+Frames are stored in the columnar .col format (see columnar.py) and memory-mapped back. Caches
+written as CSV by older versions are converted on first access, or all at once with migrate().
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+from columnar import read_frame, write_frame
+from utils import list_all_files_in_dir, option_cache_file_name, parse_cached_option_file_name
+
+MANIFEST = 'manifest.json'
+EXT = '.col'
+LEGACY_EXT = '.csv'
+
+
+def frame_size(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class HistoryCache:
+    def __init__(self, cache_dir, file_name, parse_file_name=None, memory_budget=256 * 1024 * 1024):
+        """
+        file_name(key) -> file name inside cache_dir, its extension is replaced by .col
+        parse_file_name(file name) -> key or None, used to rebuild a missing manifest and to migrate
+        """
+        self.cache_dir = cache_dir
+        self.file_name = file_name
+        self.parse_file_name = parse_file_name
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self._frames = collections.OrderedDict()  # key -> (df, size), least recently used first
+        self._manifest = None
+        self._lock = threading.RLock()
+
+    def path(self, key, ext=EXT):
+        return os.path.join(self.cache_dir, os.path.splitext(self.file_name(key))[0] + ext)
+
+    def read(self, path):
+        return read_frame(path)
+
+    def write(self, df, path):
+        write_frame(df, path)
+
+    def read_legacy(self, path):
+        df = pd.read_csv(path, index_col=0)
+        if 'datetime' in df:
+            df['datetime'] = pd.to_datetime(df['datetime'], utc=True).dt.tz_convert('EST')
+        return df
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames or os.path.isfile(self.path(key)) or os.path.isfile(self.path(key, LEGACY_EXT))
+
+    def age(self, key):
+        # seconds since key was written, None if it isn't on disk
+        path = self.path(key)
+        return time.time() - os.path.getmtime(path) if os.path.isfile(path) else None
+
+    def get(self, key, max_age=None):
+        with self._lock:
+            if max_age is not None:
+                age = self.age(key)
+                if age is None or age > max_age:
+                    self.evict(key)
+                    return None
+
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key][0]
+
+            path = self.path(key)
+            if not os.path.isfile(path):
+                if not self._migrate_file(key):
+                    return None
+            df = self.read(path)
+            self._remember(key, df)
+            return df
+
+    def put(self, key, df):
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self.path(key)
+            self.write(df, path)
+            self._remember(key, df)
+
+            manifest = self._load_manifest()
+            manifest[self._manifest_key(key)] = os.path.basename(path)
+            self._save_manifest()
+            return path
+
+    def evict(self, key):
+        with self._lock:
+            if key in self._frames:
+                self.memory_used -= self._frames.pop(key)[1]
+
+    def _migrate_file(self, key):
+        legacy = self.path(key, LEGACY_EXT)
+        if not os.path.isfile(legacy):
+            return False
+        self.write(self.read_legacy(legacy), self.path(key))
+        os.remove(legacy)
+
+        manifest = self._load_manifest()
+        manifest[self._manifest_key(key)] = os.path.basename(self.path(key))
+        self._save_manifest()
+        return True
+
+    def migrate(self):
+        # one-time conversion of every CSV file in cache_dir, returns the number converted
+        with self._lock:
+            if not self.parse_file_name or not os.path.isdir(self.cache_dir):
+                return 0
+            migrated = 0
+            for file in list_all_files_in_dir(self.cache_dir):
+                if file.endswith(LEGACY_EXT):
+                    key = self.parse_file_name(file)
+                    if key is not None and self._migrate_file(key):
+                        migrated += 1
+            return migrated
+
+    def keys(self):
+        # every key on disk, from the manifest
+        with self._lock:
+            return [tuple(json.loads(key)) for key in self._load_manifest().keys()]
+
+    def _remember(self, key, df):
+        self.evict(key)
+        size = frame_size(df)
+        self._frames[key] = (df, size)
+        self.memory_used += size
+
+        # always keep the frame just loaded, even if it alone is over budget
+        while self.memory_used > self.memory_budget and len(self._frames) > 1:
+            _, (_, evicted_size) = self._frames.popitem(last=False)
+            self.memory_used -= evicted_size
+
+    @staticmethod
+    def _manifest_key(key):
+        return json.dumps(list(key))
+
+    def _load_manifest(self):
+        if self._manifest is not None:
+            return self._manifest
+
+        path = os.path.join(self.cache_dir, MANIFEST)
+        if os.path.isfile(path):
+            with open(path) as f:
+                self._manifest = json.load(f)
+        else:
+            # first run against an old cache dir, index it once
+            self._manifest = {}
+            if self.parse_file_name and os.path.isdir(self.cache_dir):
+                for file in list_all_files_in_dir(self.cache_dir):
+                    key = self.parse_file_name(file)
+                    if key is not None:
+                        self._manifest[self._manifest_key(key)] = file
+                self._save_manifest()
+        return self._manifest
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, MANIFEST)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    # one-time migration of the Robinhood option cache: python history_cache.py [cache_dir]
+    import sys
+
+    cache = HistoryCache(sys.argv[1] if len(sys.argv) > 1 else './cache/rh/', option_cache_file_name,
+                         parse_file_name=parse_cached_option_file_name)
+    print('-- Migrated {} files --'.format(cache.migrate()))
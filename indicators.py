@@ -0,0 +1,197 @@
+"""
+Streaming indicators
+
+Every generator used to redo rolling().mean() / ewm().mean() over a symbol's whole history
+on each tick. The classes here keep running state per window instead, so feeding a new
+close costs O(1) regardless of how much history a symbol has.
+
+Outputs are bit-for-bit identical to pandas:
+    StreamingSMA  == series.rolling(window=window).mean()
+    StreamingEMA  == series.ewm(span=span, adjust=False).mean()
+"""
+import collections
+import math
+
+import numpy as np
+import pandas as pd
+
+from tick_store import RingBuffer, TickStore, to_utc_ns
+
+NAT = np.iinfo(np.int64).min
+
+
+def columns(data, names):
+    # (datetime as int64 ns UTC, *names as float) of a TickStore or DataFrame, NaT / NaN where there's none
+    if isinstance(data, TickStore):
+        return (data.column('datetime').view('i8'), *(data.column(name) for name in names))
+    if 'datetime' in data and len(data):
+        datetimes = to_utc_ns(data['datetime'])[0].view('i8')
+    else:
+        datetimes = np.full(len(data), NAT)
+    return (datetimes, *(data[name].to_numpy(dtype=float) if name in data else np.full(len(data), np.nan)
+                         for name in names))
+
+
+def series(values, name, index=None):
+    # an engine's output as a Series, on index when it lines up with the values
+    if index is not None and len(index) != len(values):
+        index = None
+    return pd.Series(values, index=index, name=name, copy=False)
+
+
+class StreamingSMA:
+    # mirrors pandas' roll_mean: kahan compensated running sum with separate add/remove compensation
+    def __init__(self, window):
+        self.window = int(window)
+        self._values = collections.deque(maxlen=self.window)
+        self._count = 0
+        self._reset(math.nan)
+
+    def _reset(self, first):
+        self._values.clear()
+        self._sum = 0.
+        self._compensation_add = 0.
+        self._compensation_remove = 0.
+        self._nobs = 0
+        self._neg_ct = 0
+        self._num_consecutive_same_value = 0
+        self._prev_value = first
+
+    def _add(self, val):
+        if val == val:
+            self._nobs += 1
+            y = val - self._compensation_add
+            t = self._sum + y
+            self._compensation_add = t - self._sum - y
+            self._sum = t
+            if math.copysign(1., val) < 0:
+                self._neg_ct += 1
+
+            if val == self._prev_value:
+                self._num_consecutive_same_value += 1
+            else:
+                self._num_consecutive_same_value = 1
+            self._prev_value = val
+
+    def _remove(self, val):
+        if val == val:
+            self._nobs -= 1
+            y = -val - self._compensation_remove
+            t = self._sum + y
+            self._compensation_remove = t - self._sum - y
+            self._sum = t
+            if math.copysign(1., val) < 0:
+                self._neg_ct -= 1
+
+    def _mean(self):
+        if self._nobs >= self.window and self._nobs > 0:
+            result = self._sum / self._nobs
+            if self._num_consecutive_same_value >= self._nobs:
+                result = self._prev_value
+            elif self._neg_ct == 0 and result < 0:
+                result = 0.
+            elif self._neg_ct == self._nobs and result > 0:
+                result = 0.
+            return result
+        return math.nan
+
+    def update(self, value):
+        value = float(value)
+        # pandas re-seeds the window whenever it no longer overlaps the previous one
+        if self._count == 0 or self.window == 1:
+            self._reset(value)
+        elif len(self._values) == self.window:
+            self._remove(self._values[0])
+
+        self._values.append(value)
+        self._add(value)
+        self._count += 1
+        return self._mean()
+
+
+class StreamingEMA:
+    # mirrors pandas' ewm(adjust=False, ignore_na=False).mean()
+    def __init__(self, span):
+        self.span = span
+        com = (span - 1) / 2.
+        alpha = 1. / (1. + com)
+        self._old_wt_factor = 1. - alpha
+        self._new_wt = alpha
+        self._old_wt = 1.
+        self._weighted = math.nan
+        self._nobs = 0
+        self._count = 0
+
+    def update(self, value):
+        cur = float(value)
+        is_observation = cur == cur
+        self._nobs += is_observation
+
+        if self._count == 0:
+            self._weighted = cur
+        elif self._weighted == self._weighted:
+            self._old_wt *= self._old_wt_factor
+            if is_observation:
+                if self._weighted != cur:
+                    self._weighted = self._old_wt * self._weighted + self._new_wt * cur
+                    self._weighted /= (self._old_wt + self._new_wt)
+                self._old_wt = 1.
+        elif is_observation:
+            self._weighted = cur
+
+        self._count += 1
+        return self._weighted if self._nobs >= 1 else math.nan
+
+
+class IndicatorEngine:
+    """
+    Running SMA/EMA state for a single symbol.
+
+    `seen` counts how many closes have been consumed so callers can hand over only the rows
+    appended since the last update. Outputs keep at most max_history values, like TickStore.
+    """
+    def __init__(self, sma_windows=(), ema_spans=(), max_history=None):
+        self.indicators = {}
+        for window in sma_windows:
+            self.indicators['SMA_{}'.format(window)] = StreamingSMA(window)
+        for span in ema_spans:
+            self.indicators['EMA_{}'.format(span)] = StreamingEMA(span)
+        self.outputs = {name: RingBuffer(np.float64, maxlen=max_history) for name in self.indicators}
+        self.seen = 0
+
+    def update(self, values):
+        for value in values:
+            for name, indicator in self.indicators.items():
+                self.outputs[name].append(indicator.update(value))
+            self.seen += 1
+
+    def values(self, name):
+        return self.outputs[name].view()
+
+    def series(self, name, index=None):
+        return series(self.values(name), name, index)
+
+
+class Signals(dict):
+    # signals dict that also carries the streaming state its generators keep between ticks
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.engines = {}
+        self.legs = {}  # option leg symbol -> its Trader symbol info, set on underlyings
+        self.symbol = None
+        self.store = None  # FeatureStore engines are loaded from and saved to (feature_store.py)
+
+
+def get_engine(signals, key, factory, data=None):
+    # plain dicts carry no state, callers then get a fresh engine and a full recompute
+    engines = getattr(signals, 'engines', None)
+    if engines is None:
+        return factory()
+    if key not in engines:
+        # engines that only depend on data pass it, so a stored one can pick up where it was
+        store = getattr(signals, 'store', None) if data is not None else None
+        engine = store.load(signals.symbol, key, data) if store is not None else None
+        engines[key] = engine if engine is not None else factory()
+        if store is not None:
+            store.track(signals, key, data)
+    return engines[key]
@@ -0,0 +1,287 @@
+"""
+Hot path instrumentation
+
+Timers record into log-bucket histograms (bucket i holds durations up to 2^i microseconds), so an
+observation is a frexp and two adds and it is fine to leave on. Counters are plain integers.
+
+    with timer('trader.signals'):
+        ...
+    count('cache.td.hit')
+
+    write_snapshot('./metrics.json')  # or REGISTRY.prometheus() / serve(9100)
+
+Trader ticks run under tick(): with a SlowTickProfiler attached, a sampler thread records the
+stacks of the thread running the tick, and ticks that take longer than the profiler's threshold
+keep their samples.
+"""
+import collections
+import contextlib
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+BUCKETS = 27  # 1us .. 2^26us (~67s), slower observations land in the last bucket
+
+
+def _bucket(seconds):
+    micros = seconds * 1e6
+    if micros <= 1:
+        return 0
+    return min(math.frexp(micros - 1e-9)[1], BUCKETS - 1)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, seconds):
+        self.buckets[_bucket(seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # upper bound of the bucket holding quantile q, in seconds
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': {2 ** i: n for i, n in enumerate(self.buckets) if n},  # upper bound in us -> count
+        }
+
+
+class SlowTickProfiler:
+    """
+    Samples the stack of the thread running a tick every interval seconds. Ticks longer than
+    threshold seconds keep their samples as {collapsed stack: count} in slow_ticks (most recent
+    keep_last), and hook(name, seconds, stacks) is called if given.
+    """
+    def __init__(self, threshold=0.05, interval=0.002, keep_last=20, hook=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.hook = hook
+        self.slow_ticks = collections.deque(maxlen=keep_last)
+        self._target = None
+        self._samples = collections.Counter()
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            target = self._target
+            if target is None:
+                continue
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append('{}:{}'.format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+                frame = frame.f_back
+            with self._lock:
+                if self._target == target:
+                    self._samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        with self._lock:
+            self._samples = collections.Counter()
+            self._target = threading.get_ident()
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._run, name='slow-tick-profiler', daemon=True)
+            self._sampler.start()
+
+    def stop(self, name, seconds):
+        with self._lock:
+            self._target = None
+            samples = self._samples
+        if seconds >= self.threshold:
+            self.slow_ticks.append({'name': name, 'seconds': seconds, 'stacks': dict(samples)})
+            if self.hook is not None:
+                self.hook(name, seconds, dict(samples))
+
+
+class _Timer:
+    # plain class rather than contextlib.contextmanager, this is on every tick's path
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Registry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = collections.defaultdict(Histogram)
+        self.counters = collections.defaultdict(int)
+        self.profiler = None
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self.histograms[name].observe(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def timer(self, name):
+        return _Timer(self.histograms[name]) if self.enabled else _NULL_TIMER
+
+    def timed(self, name):
+        # decorator form of timer
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    @contextlib.contextmanager
+    def tick(self, name='trader.tick'):
+        # timer that also runs the slow tick profiler, if one is attached
+        profiler = self.profiler if self.enabled else None
+        if profiler is not None:
+            profiler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds)
+            if profiler is not None:
+                profiler.stop(name, seconds)
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+    def snapshot(self):
+        snapshot = {
+            'time': time.time(),
+            'timers': {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
+        if self.profiler is not None:
+            snapshot['slow_ticks'] = list(self.profiler.slow_ticks)
+        return snapshot
+
+    def write_snapshot(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def prometheus(self, prefix='printing_money'):
+        # Prometheus text exposition format, timers as histograms in seconds
+        def metric(name):
+            return '{}_{}'.format(prefix, ''.join(c if c.isalnum() else '_' for c in name))
+
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            name = metric(name) + '_seconds'
+            lines.append('# TYPE {} histogram'.format(name))
+            cumulative = 0
+            for i, n in enumerate(histogram.buckets):
+                cumulative += n
+                if n:
+                    lines.append('{}_bucket{{le="{:g}"}} {}'.format(name, 2 ** i / 1e6, cumulative))
+            lines.append('{}_bucket{{le="+Inf"}} {}'.format(name, histogram.count))
+            lines.append('{}_sum {}'.format(name, histogram.sum))
+            lines.append('{}_count {}'.format(name, histogram.count))
+        for name, value in sorted(self.counters.items()):
+            name = metric(name) + '_total'
+            lines.append('# TYPE {} counter'.format(name))
+            lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        # /metrics on a background thread, returns the server (call shutdown() to stop)
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+
+@functools.lru_cache(maxsize=None)
+def generator_name(generator):
+    while isinstance(generator, functools.partial):
+        generator = generator.func
+    return getattr(generator, '__name__', type(generator).__name__)
+
+
+REGISTRY = Registry(enabled=os.getenv('PRINTING_MONEY_METRICS', '1') != '0')
+
+
+def profile_slow_ticks(threshold=0.05, **options):
+    # attach a SlowTickProfiler to REGISTRY, threshold in seconds
+    REGISTRY.profiler = SlowTickProfiler(threshold, **options)
+    return REGISTRY.profiler
+
+
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+tick = REGISTRY.tick
+count = REGISTRY.count
+observe = REGISTRY.observe
+snapshot = REGISTRY.snapshot
+write_snapshot = REGISTRY.write_snapshot
+serve = REGISTRY.serve
@@ -0,0 +1,207 @@
+"""
+Tick journal
+
+Appends every tick of a session to a binary file of fixed-width records, and replays journals
+back through Trader:
+
+    b'PMTJ1\\n' | uint64 header length | JSON header | padding to 64 | record | record | ...
+
+    record: ts (int64 ns UTC) | symbol id (uint32) | pad | open | high | low | close | volume | bid | ask
+
+Fields a tick doesn't have are NaN. Symbol names go in a sidecar <journal>.symbols file, one per
+line, the line number being the id. Both files are only ever appended to. A record cut short by
+a crash is ignored on read.
+
+Records are buffered in a NumPy array and written in blocks, so a write is a few stores into that
+array. Reading memory-maps the file as a structured array. JournalReplayer feeds the records to
+Trader.receive_tick at full speed, or paced at a multiple of the recorded time (speed=60 replays
+an hour in a minute).
+"""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+from symbols import is_option
+
+MAGIC = b'PMTJ1\n'
+ALIGNMENT = 64
+EXT = '.tj'
+
+RECORD = np.dtype([
+    ('ts', '<i8'),
+    ('symbol', '<u4'),
+    ('pad', '<u4'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+])
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume', 'bid', 'ask']
+NAT = np.iinfo(np.int64).min
+
+
+def session_path(directory, date=None):
+    # one journal per trading day: <directory>/<YYYY-MM-DD>.tj
+    date = pd.Timestamp.now(tz='EST') if date is None else pd.Timestamp(date)
+    return os.path.join(directory, date.strftime('%Y-%m-%d') + EXT)
+
+
+def symbols_path(path):
+    return path + '.symbols'
+
+
+def _to_ns(ts):
+    # Timestamp.value is nanoseconds since the epoch in UTC, whatever the tz
+    if ts is None or pd.isnull(ts):
+        return NAT
+    return ts.value if isinstance(ts, pd.Timestamp) else pd.Timestamp(ts).value
+
+
+class JournalWriter:
+    def __init__(self, path, tz='EST', buffer_rows=4096):
+        self.path = path
+        self.tz = tz
+        self.symbols = {}
+        self._buffer = np.zeros(buffer_rows, dtype=RECORD)
+        self._n = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            # continuing a session: keep its tz and symbol ids, drop a torn last record
+            header, offset = read_header(path)
+            self.tz = header['tz']
+            self.symbols = {symbol: i for i, symbol in enumerate(read_symbols(path))}
+            size = os.path.getsize(path)
+            self._file = open(path, 'r+b')
+            self._file.truncate(offset + (size - offset) // RECORD.itemsize * RECORD.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(path, 'wb')
+            self._write_header()
+        self._symbols_file = open(symbols_path(path), 'a')
+
+    def _write_header(self):
+        raw = json.dumps({'version': 1, 'tz': self.tz, 'record': RECORD.descr, 'created': time.time()}).encode()
+        start = len(MAGIC) + 8 + len(raw)
+        self._file.write(MAGIC + struct.pack('<Q', len(raw)) + raw + b'\0' * (-start % ALIGNMENT))
+
+    def symbol_id(self, symbol):
+        symbol_id = self.symbols.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbols[symbol] = len(self.symbols)
+            self._symbols_file.write(symbol + '\n')
+            self._symbols_file.flush()
+        return symbol_id
+
+    def write(self, tick):
+        # tick: dict / Series with symbol, datetime and any of FIELDS
+        values = [tick.get(field) for field in FIELDS]
+        self._buffer[self._n] = (_to_ns(tick.get('datetime')), self.symbol_id(tick['symbol']), 0,
+                                 *(np.nan if value is None else value for value in values))
+        self._n += 1
+        if self._n == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        if self._n:
+            self._file.write(self._buffer[:self._n].tobytes())
+            self._n = 0
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._symbols_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_header(path):
+    # (header, byte offset of the first record)
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a tick journal'.format(path))
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length))
+    start = len(MAGIC) + 8 + length
+    return header, start + (-start % ALIGNMENT)
+
+
+def read_symbols(path):
+    if not os.path.isfile(symbols_path(path)):
+        return []
+    with open(symbols_path(path)) as f:
+        return f.read().splitlines()
+
+
+def read_records(path):
+    # memory-mapped structured array of every complete record
+    _, offset = read_header(path)
+    rows = (os.path.getsize(path) - offset) // RECORD.itemsize
+    if rows == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=offset, shape=(rows,)).view(np.ndarray)
+
+
+def read_journal(path):
+    # the journal as a DataFrame: symbol, datetime (tz-aware) and FIELDS
+    header, _ = read_header(path)
+    records = read_records(path)
+    symbols = np.array(read_symbols(path), dtype=object)
+    df = pd.DataFrame({field: records[field] for field in FIELDS})
+    df.insert(0, 'datetime', pd.DatetimeIndex(records['ts'].view('M8[ns]')).tz_localize('UTC').tz_convert(header['tz']))
+    df.insert(0, 'symbol', symbols[records['symbol']] if len(records) else np.empty(0, dtype=object))
+    return df
+
+
+class JournalReplayer:
+    def __init__(self, paths, chunk_rows=65536):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.chunk_rows = chunk_rows
+
+    def ticks(self):
+        # tick dicts in journal order, converted a chunk at a time
+        for path in self.paths:
+            header, _ = read_header(path)
+            records = read_records(path)
+            symbols = read_symbols(path)
+            for start in range(0, len(records), self.chunk_rows):
+                chunk = records[start:start + self.chunk_rows]
+                datetimes = pd.DatetimeIndex(chunk['ts'].view('M8[ns]')).tz_localize('UTC').tz_convert(header['tz'])
+                columns = [chunk[field].tolist() for field in FIELDS]
+                for symbol_id, ts, *values in zip(chunk['symbol'].tolist(), datetimes, *columns):
+                    tick = dict(zip(FIELDS, values))
+                    tick['symbol'] = symbols[symbol_id]
+                    tick['datetime'] = ts
+                    yield tick
+
+    def replay(self, trader, speed=None, should_update=lambda symbol: not is_option(symbol), clock=time.monotonic,
+               sleep=time.sleep):
+        """
+        Feeds every tick to trader.receive_tick. speed None replays as fast as possible, otherwise
+        ticks are paced at speed x the recorded time between them. Returns (ticks, orders).
+        """
+        n, orders = 0, []
+        first_ts, started = None, clock()
+        for tick in self.ticks():
+            if speed is not None and not pd.isnull(tick['datetime']):
+                if first_ts is None:
+                    first_ts = tick['datetime']
+                delay = (tick['datetime'] - first_ts).total_seconds() / speed - (clock() - started)
+                if delay > 0:
+                    sleep(delay)
+            orders.extend(trader.receive_tick(tick, should_update(tick['symbol'])))
+            n += 1
+        return n, orders
@@ -0,0 +1,77 @@
+"""
+Concurrent history loading
+
+get_initial_data / get_test_data used to fetch every position's history one after another and
+fetched an underlying once per option leg on it. HistoryLoader takes all the requests up front,
+drops duplicates and runs the rest on one thread pool per source, sized to that source's
+concurrency limit so we stay polite to each API and a burst for one source never holds up
+another. A portfolio's startup then costs roughly one round trip instead of one per leg.
+
+    loader = HistoryLoader({'td': td_fetcher, 'rh': rh_fetcher})
+    data = loader.load({'AMD': stock_request('AMD'),
+                        'AMD_031921C92.5': option_request('AMD', '2021-03-19', 92.5)})
+"""
+import collections
+import concurrent.futures
+import contextlib
+
+Request = collections.namedtuple('Request', ['source', 'symbol', 'params'])
+
+# fetcher method each source's requests are sent to
+SOURCE_METHODS = {
+    'td': 'get_historical_stock',
+    'rh': 'get_historical_options',
+}
+
+# requests in flight per source
+SOURCE_LIMITS = {
+    'td': 8,
+    'rh': 16,
+}
+
+
+def make_request(source, symbol, **params):
+    # params are frozen so equal requests hash equal
+    return Request(source, symbol, tuple(sorted(params.items())))
+
+
+def stock_request(symbol, **params):
+    return make_request('td', symbol, **params)
+
+
+def option_request(underlying, exp, strike, option_type='call', **params):
+    return make_request('rh', underlying, exp=exp, strike=float(strike), option_type=option_type, **params)
+
+
+class HistoryLoader:
+    def __init__(self, fetchers, limits=SOURCE_LIMITS, max_workers=32):
+        self.fetchers = fetchers
+        self.max_workers = max_workers  # threads per source at most, whatever its limit
+        self.limits = {source: limits.get(source, 1) for source in fetchers}
+
+    def fetch(self, request):
+        fetcher = self.fetchers[request.source]
+        return getattr(fetcher, SOURCE_METHODS[request.source])(request.symbol, **dict(request.params))
+
+    def load_requests(self, requests):
+        # distinct requests -> DataFrame, each fetched once
+        unique = list(dict.fromkeys(requests))
+        if not unique:
+            return {}
+
+        by_source = collections.defaultdict(list)
+        for request in unique:
+            by_source[request.source].append(request)
+
+        with contextlib.ExitStack() as stack:
+            futures = {}
+            for source, source_requests in by_source.items():
+                workers = min(self.limits[source], self.max_workers, len(source_requests))
+                executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=workers))
+                futures.update((request, executor.submit(self.fetch, request)) for request in source_requests)
+            return {request: futures[request].result() for request in unique}
+
+    def load(self, requests_by_key):
+        # {key: Request} -> {key: DataFrame}, keys sharing a request share the result
+        results = self.load_requests(requests_by_key.values())
+        return {key: results[request] for key, request in requests_by_key.items()}
@@ -0,0 +1,75 @@
+"""
+FIFO lot matching
+
+get_active_positions used to filter the whole transactions frame once per position to find the
+buys behind it. LotIndex groups the BUY TRADE rows by symbol once, oldest first. Under FIFO,
+sells close the oldest lots, so a position of quantity q is made of the newest buys adding up to q.
+Each lookup is a binary search over that symbol's cumulative quantities.
+"""
+import numpy as np
+import pandas as pd
+
+TRANSACTION_KEYS = ['settlementDate', 'transactionDate', 'transactionId', 'netAmount', 'optionExpirationDate']
+
+
+class Lots:
+    # one symbol's buys, oldest first
+    __slots__ = ('rows', 'amounts', 'remaining')
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.amounts = rows['amount'].to_numpy(dtype=np.float64)
+        # remaining[i] = quantity bought from lot i onwards
+        self.remaining = np.cumsum(self.amounts[::-1])[::-1]
+
+
+class LotIndex:
+    def __init__(self, transactions, trade_type='BUY TRADE'):
+        self.lots = {}
+        if len(transactions) == 0 or 'tradeType' not in transactions:
+            return
+
+        buys = transactions[transactions['tradeType'] == trade_type]
+        buys = buys.sort_values(['transactionDate', 'transactionId'], kind='stable')
+        for symbol, rows in buys.groupby('symbol', sort=False):
+            self.lots[symbol] = Lots(rows.reset_index(drop=True))
+
+    def match(self, symbol, quantity):
+        """
+        Open lots of a position: the newest buys covering quantity, the oldest one possibly only
+        partly. Returns None if there are no buys for symbol, otherwise the TRANSACTION_KEYS of the
+        oldest open lot with netAmount summed over the open lots, plus:
+
+            costBasis   cost of the open quantity, partial lot prorated
+            openDate    transactionDate of the oldest open lot
+        """
+        lots = self.lots.get(symbol)
+        if lots is None or quantity <= 0:
+            return None
+
+        # first lot from which the buys still add up to quantity
+        start = max(int(np.searchsorted(-lots.remaining, -quantity, side='right')) - 1, 0)
+        excess = max(lots.remaining[start] - quantity, 0.)
+        fraction = np.ones(len(lots.amounts) - start)
+        if lots.amounts[start] > 0:
+            fraction[0] = 1. - excess / lots.amounts[start]
+
+        rows = lots.rows.iloc[start:]
+        oldest = rows.iloc[0]
+        match = {key: oldest[key] if key in oldest else None for key in TRANSACTION_KEYS}
+        match['netAmount'] = float((rows['netAmount'].to_numpy(dtype=np.float64) * fraction).sum())
+        match['costBasis'] = float((rows['cost'].to_numpy(dtype=np.float64) * fraction).sum()) \
+            if 'cost' in rows else None
+        match['openDate'] = oldest['transactionDate']
+        return match
+
+    def match_positions(self, positions):
+        # one record per position row, keys set to None when nothing matched
+        records = []
+        for symbol, long_quantity, short_quantity in zip(positions['symbol'], positions['longQuantity'],
+                                                         positions['shortQuantity']):
+            quantity = long_quantity if long_quantity != 0 else short_quantity
+            match = self.match(symbol, quantity)
+            records.append(match if match is not None else
+                           {key: None for key in TRANSACTION_KEYS + ['costBasis', 'openDate']})
+        return pd.DataFrame.from_records(records, index=positions.index)
@@ -0,0 +1,43 @@
+"""
+Offline stand-in for TdAccount
+
+Holds a positions frame instead of a TD account. sell_position fills at its limit price, or the last
+price seen for the symbol (set with mark) for a market order, and drops the position. The fills are
+kept for building results.
+"""
+from symbols import is_option
+
+
+class MockClient:
+    def __init__(self, positions):
+        self.td_client = {}
+        self.positions = positions
+        self.portfolio = None
+        self.portfolio_df = None
+        self.last_prices = {}
+        self.now = None
+        self.fills = {}
+        self.get_active_positions()
+
+    def get_active_positions(self):
+        # start with all buys, remove
+        self.portfolio_df = self.positions
+        self.portfolio = self.portfolio_df.to_dict(orient='records')
+
+        return self.portfolio_df
+
+    def get_portfolio_tickers(self):
+        return [position['underlyingSymbol'] for position in self.portfolio]
+
+    def get_option_tickers(self):
+        return list(dict.fromkeys(position['symbol'] for position in self.portfolio if is_option(position['symbol'])))
+
+    def mark(self, tick):
+        self.last_prices[tick['symbol']] = tick['close']
+        self.now = tick['datetime'] if 'datetime' in tick else None
+
+    def sell_position(self, symbol, limit_price=None):
+        price = self.last_prices.get(symbol) if limit_price is None else limit_price
+        self.fills[symbol] = {'price': price, 'datetime': self.now, 'reasons': []}
+        self.positions = self.positions[self.positions['symbol'] != symbol]
+        self.get_active_positions()
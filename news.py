@@ -0,0 +1,264 @@
+"""
+News and sentiment
+
+news_signal_generator (seller.py) runs on every evaluation and must not wait on the network.
+NewsService keeps the news per symbol in a TTL cache and refreshes it in the background, on the
+stream's event loop:
+
+- lookup(symbol) is a cache read. When the cached news is older than ttl (or missing) it also
+  queues a refresh and returns right away, thread-safe as Trader runs in an executor
+- a symbol is fetched at most once at a time, lookups while it's in flight don't queue another
+- refreshes are taken off the queue in batches and fetched concurrently, at most max_concurrency
+  requests at once, then all their headlines are scored in one call to the scorer, off the loop
+- a failed fetch, malformed items or a failing scorer keep the previous news, retried after ttl
+
+Sources are anything with an async fetch(symbol) -> [{'headline', 'datetime', ...}]: FileNewsSource
+reads a JSON lines file (the offline stand-in), HttpNewsSource a JSON endpoint. Scorers are
+callables from a list of texts to one score in [-1, 1] each, LexiconScorer counts words.
+
+Run it with the stream: StreamPipeline(trader, news=service) starts service.run() alongside the
+evaluator, and functools.partial(news_signal_generator, news=service) goes in the generators.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from indicators import series
+from tick_store import RingBuffer
+
+POSITIVE = {
+    'beat', 'beats', 'bullish', 'buy', 'gain', 'gains', 'growth', 'high', 'jump', 'jumps', 'outperform',
+    'profit', 'raise', 'raised', 'rally', 'record', 'rise', 'rises', 'soar', 'soars', 'strong', 'surge',
+    'surges', 'upgrade', 'upgraded', 'win',
+}
+NEGATIVE = {
+    'bearish', 'cut', 'cuts', 'decline', 'declines', 'downgrade', 'downgraded', 'drop', 'drops', 'fall',
+    'falls', 'fraud', 'lawsuit', 'loss', 'losses', 'low', 'miss', 'misses', 'plunge', 'plunges', 'recall',
+    'sell', 'slump', 'underperform', 'weak', 'warning',
+}
+WORD = re.compile(r"[a-z']+")
+
+
+class LexiconScorer:
+    # (positive - negative) / (positive + negative) word count of each text, 0 without any
+    def __init__(self, positive=POSITIVE, negative=NEGATIVE):
+        self.positive = frozenset(positive)
+        self.negative = frozenset(negative)
+
+    def __call__(self, texts):
+        scores = np.zeros(len(texts))
+        for i, text in enumerate(texts):
+            words = WORD.findall(text.lower())
+            positive = sum(word in self.positive for word in words)
+            negative = sum(word in self.negative for word in words)
+            if positive + negative:
+                scores[i] = (positive - negative) / (positive + negative)
+        return scores
+
+
+class FileNewsSource:
+    # JSON lines of {symbol, headline, datetime, ...}, re-read whenever the file changes
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._items = {}
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            items = {}
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        items.setdefault(item['symbol'], []).append(item)
+            self._items, self._mtime = items, mtime
+        return self._items
+
+    async def fetch(self, symbol):
+        if not os.path.isfile(self.path):
+            return []
+        return list(self._load().get(symbol, []))
+
+
+class HttpNewsSource:
+    def __init__(self, url, params=None, timeout=10):
+        """
+        url      endpoint returning a JSON list of items, may contain {symbol}
+        params   symbol -> query parameters, {'symbol': symbol} by default
+        """
+        self.url = url
+        self.params = params or (lambda symbol: {'symbol': symbol})
+        self.timeout = timeout
+
+    def _get(self, symbol):
+        import requests
+        response = requests.get(self.url.format(symbol=symbol), params=self.params(symbol), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch(self, symbol):
+        # requests blocks, so it runs in the loop's executor
+        return await asyncio.get_running_loop().run_in_executor(None, self._get, symbol)
+
+
+class NewsEntry:
+    __slots__ = ('fetched_at', 'items', 'scores', 'error')
+
+    def __init__(self, fetched_at, items, scores, error=None):
+        self.fetched_at = fetched_at
+        self.items = items
+        self.scores = scores
+        self.error = error
+
+    @property
+    def sentiment(self):
+        return float(np.mean(self.scores)) if len(self.scores) else np.nan
+
+
+class NewsCache:
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}  # symbol -> NewsEntry
+
+    def get(self, symbol):
+        # the last news fetched for symbol however old, None if never
+        return self.entries.get(symbol)
+
+    def stale(self, symbol):
+        entry = self.entries.get(symbol)
+        return entry is None or self.clock() - entry.fetched_at >= self.ttl
+
+    def put(self, symbol, items, scores, error=None):
+        self.entries[symbol] = NewsEntry(self.clock(), items, scores, error)
+
+
+class NewsService:
+    def __init__(self, source, scorer=None, ttl=300, max_concurrency=4, batch_size=32, clock=time.monotonic):
+        self.source = source
+        self.scorer = scorer or LexiconScorer()
+        self.cache = NewsCache(ttl, clock)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.pending = set()  # symbols queued or being fetched
+        self.fetches = 0
+        self.errors = 0
+        self.loop = None
+        self.queue = None
+        self._lock = threading.Lock()
+
+    def lookup(self, symbol):
+        # cached NewsEntry or None, never blocks
+        if self.cache.stale(symbol):
+            self.want(symbol)
+        return self.cache.get(symbol)
+
+    def want(self, symbol):
+        # queues a refresh of symbol unless one is already pending, a no-op until run() has started
+        with self._lock:
+            if self.loop is None or symbol in self.pending:
+                return
+            self.pending.add(symbol)
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, symbol)
+
+    async def _fetch(self, symbol):
+        async with self.semaphore:
+            self.fetches += 1
+            try:
+                return await self.source.fetch(symbol), None
+            except Exception as e:
+                self.errors += 1
+                return None, e
+
+    async def refresh(self, symbols):
+        try:
+            results = await asyncio.gather(*(self._fetch(symbol) for symbol in symbols))
+
+            # one scoring call for every headline of the batch
+            texts, owners = [], []
+            for i, (symbol, (items, error)) in enumerate(zip(symbols, results)):
+                try:
+                    symbol_texts = [item.get('headline', '') + ' ' + item.get('summary', '') for item in items or []]
+                except Exception as e:
+                    self.errors += 1
+                    results[i] = (None, e)
+                    continue
+                texts.extend(symbol_texts)
+                owners.extend([symbol] * len(symbol_texts))
+            try:
+                scores = await asyncio.get_running_loop().run_in_executor(None, self.scorer, texts) if texts else []
+                scores = np.asarray(scores, dtype=float)
+                if scores.shape != (len(texts),):
+                    raise ValueError('{} scores for {} texts'.format(scores.size, len(texts)))
+            except Exception as e:
+                self.errors += 1
+                results = [(None, error or e) for _, error in results]
+                scores = np.empty(0)
+                owners = []
+            owners = np.array(owners, dtype=object)
+
+            for symbol, (items, error) in zip(symbols, results):
+                if error is None:
+                    self.cache.put(symbol, items, scores[owners == symbol])
+                else:
+                    previous = self.cache.get(symbol)
+                    self.cache.put(symbol, previous.items if previous else [],
+                                   previous.scores if previous else np.empty(0), error)
+        finally:
+            with self._lock:
+                self.pending.difference_update(symbols)
+
+    async def run(self):
+        # refreshes queued symbols until cancelled
+        self.queue = asyncio.Queue()
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        with self._lock:
+            self.loop = asyncio.get_running_loop()
+        try:
+            while True:
+                symbols = [await self.queue.get()]
+                while len(symbols) < self.batch_size and not self.queue.empty():
+                    symbols.append(self.queue.get_nowait())
+                try:
+                    await self.refresh(symbols)
+                except Exception:
+                    # refresh records its errors per symbol, whatever else goes wrong mustn't stop the news
+                    self.errors += 1
+        finally:
+            with self._lock:
+                self.loop = None
+                self.pending.clear()
+
+
+class NewsFeatures:
+    """
+    NEWS_SENTIMENT / NEWS_COUNT per row of a symbol's data, as cached when the row was evaluated.
+    Rows from before the first evaluation are NaN.
+    """
+    NAMES = ['NEWS_SENTIMENT', 'NEWS_COUNT']
+
+    def __init__(self, max_history=None):
+        self.values = {name: RingBuffer(np.float64, 1024, max_history) for name in self.NAMES}
+        self.seen = 0
+
+    def record(self, total, entry):
+        new = total - self.seen
+        if new <= 0:
+            return
+        values = (entry.sentiment, len(entry.items)) if entry is not None else (np.nan, np.nan)
+        history = new - 1 if self.seen == 0 else 0
+        for name, value in zip(self.NAMES, values):
+            self.values[name].extend(np.full(new, value))
+            if history:
+                self.values[name].view()[-new:-1] = np.nan
+        self.seen = total
+
+    def series(self, name, index=None):
+        return series(self.values[name].view(), name, index)
@@ -0,0 +1,167 @@
+"""
+Order book
+
+Trader used to sell at whatever the broker filled, blind to the bid/ask. OrderBook keeps one
+bintrees red-black tree per side (price -> size), so a level update is O(log n). The best bid and
+ask are cached on every update, which makes best / spread / mid / imbalance O(1).
+
+The level one stream only carries the top of the book. update_top() applies it by dropping the
+levels it shows are gone: the previous best whenever the price moves, and any bids above the new
+best bid / asks below the new best ask. A level one book so holds one level per side. Depth feeds
+can use update_level() directly.
+
+Trader keeps an OrderBookFeatures per quoted symbol, order_book_signal_generator (seller.py)
+publishes its SPREAD / MID / IMBALANCE as signals and sell_price() prices exits: at the bid when
+the spread is tight, towards the mid when it's wide.
+"""
+import numpy as np
+from bintrees import FastRBTree
+
+from indicators import series
+from tick_store import RingBuffer
+
+BID, ASK = 'bid', 'ask'
+
+
+class OrderBook:
+    def __init__(self):
+        self.bids = FastRBTree()
+        self.asks = FastRBTree()
+        self.best_bid = None  # (price, size)
+        self.best_ask = None
+
+    def _refresh(self, side):
+        if side == BID:
+            self.best_bid = self.bids.max_item() if self.bids else None
+        else:
+            self.best_ask = self.asks.min_item() if self.asks else None
+
+    def update_level(self, side, price, size):
+        # size 0 (or None) removes the level
+        tree = self.bids if side == BID else self.asks
+        if not size:
+            tree.discard(price)
+        else:
+            tree.insert(price, size)
+        self._refresh(side)
+
+    def update_top(self, bid=None, ask=None, bid_size=None, ask_size=None):
+        # level one update, None fields are unchanged
+        if bid is not None:
+            self._update_best(BID, bid, bid_size)
+        elif bid_size is not None and self.best_bid is not None:
+            self.update_level(BID, self.best_bid[0], bid_size)
+
+        if ask is not None:
+            self._update_best(ASK, ask, ask_size)
+        elif ask_size is not None and self.best_ask is not None:
+            self.update_level(ASK, self.best_ask[0], ask_size)
+
+    def _update_best(self, side, price, size):
+        if side == BID:
+            tree, best = self.bids, self.best_bid
+        else:
+            tree, best = self.asks, self.best_ask
+        if best is not None and price == best[0]:
+            if size is None or size == best[1]:
+                return  # most quotes only move the last price
+        else:
+            # the previous best moved, and levels better than the new best are gone
+            if best is not None:
+                tree.discard(best[0])
+            if side == BID:
+                while tree and tree.max_key() > price:
+                    tree.pop_max()
+            else:
+                while tree and tree.min_key() < price:
+                    tree.pop_min()
+        if size is None:
+            size = tree.get(price) or 1
+        tree.insert(price, size)
+        self._refresh(side)
+
+    @property
+    def ready(self):
+        return self.best_bid is not None and self.best_ask is not None
+
+    @property
+    def spread(self):
+        return self.best_ask[0] - self.best_bid[0] if self.ready else np.nan
+
+    @property
+    def mid(self):
+        return (self.best_ask[0] + self.best_bid[0]) / 2 if self.ready else np.nan
+
+    @property
+    def relative_spread(self):
+        mid = self.mid
+        return self.spread / mid if mid > 0 else np.nan
+
+    @property
+    def imbalance(self):
+        # (bid size - ask size) / (bid size + ask size) at the top, in [-1, 1], > 0 means buyers are heavier
+        if not self.ready:
+            return np.nan
+        bid_size, ask_size = self.best_bid[1], self.best_ask[1]
+        total = bid_size + ask_size
+        return (bid_size - ask_size) / total if total else 0.
+
+    def sell_price(self, max_spread=0.02, aggressiveness=0.5, tick=0.01):
+        """
+        Limit price for a sell. With the relative spread at most max_spread it is the bid. Wider
+        spreads sell at mid - aggressiveness * half spread (1 is the bid, 0 the mid), rounded down
+        to tick. None without both sides of the book.
+        """
+        if not self.ready:
+            return None
+        bid = self.best_bid[0]
+        if self.relative_spread <= max_spread:
+            return bid
+        price = self.mid - aggressiveness * self.spread / 2
+        return max(np.floor(price / tick + 1e-9) * tick, bid)
+
+
+def _quote(tick, field):
+    value = tick.get(field)
+    return None if value is None or value != value else float(value)
+
+
+def has_quote(tick):
+    return _quote(tick, 'bid') is not None or _quote(tick, 'ask') is not None
+
+
+def update_from_tick(book, tick):
+    # tick fields as set by stream.QuoteConverter, returns whether the tick carried a quote
+    bid, ask = _quote(tick, 'bid'), _quote(tick, 'ask')
+    if bid is None and ask is None:
+        return False
+    book.update_top(bid, ask, _quote(tick, 'bid_size'), _quote(tick, 'ask_size'))
+    return True
+
+
+class OrderBookFeatures:
+    """
+    The book of one symbol plus SPREAD / MID / IMBALANCE per row of its data, as of when the row
+    was appended. Rows from before the first quote are NaN.
+    """
+    NAMES = ['SPREAD', 'MID', 'IMBALANCE']
+
+    def __init__(self, max_history=None):
+        self.book = OrderBook()
+        self.seen = 0
+        self.values = {name: RingBuffer(np.float64, 1024, max_history) for name in self.NAMES}
+
+    def record(self, total):
+        # called once the data holds total rows (TickStore.total), fills the rows since the last call
+        missing = total - self.seen
+        if missing <= 0:
+            return
+        book = self.book
+        for name, value in zip(self.NAMES, (book.spread, book.mid, book.imbalance)):
+            if missing > 1:
+                self.values[name].extend(np.full(missing - 1, np.nan))
+            self.values[name].append(value)
+        self.seen = total
+
+    def series(self, name, index=None):
+        return series(self.values[name].view(), name, index)
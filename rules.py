@@ -0,0 +1,160 @@
+"""
+Declarative condition rules
+
+A condition generator is Python `if` blocks run one symbol at a time on .iloc[-k] lookups.
+Rules state the same conditions as data:
+
+    crossover('ema_200_cross_over', 'close', 'EMA_200', lookback=5)
+    band('ema_50_vicinity', 'EMA_50', 'close', (0.98, 1.02))
+
+A RuleSet looks at the last few bars of every symbol at once. It builds a panel with one
+(symbols x bars) matrix per series the rules use, right aligned so column -1 is each symbol's
+latest bar, and each rule is a handful of NumPy operations on that panel. Operand names are
+looked up in a symbol's signals, then in its data. A rule doesn't fire for a symbol missing any
+series it uses, or with fewer bars than it looks back over, just like the `'EMA_200' in signals`
+and .iloc guards in the generators.
+"""
+import operator
+
+import numpy as np
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class Ratio:
+    def __init__(self, numerator, denominator):
+        self.numerator = numerator
+        self.denominator = denominator
+
+    def names(self):
+        return operand_names(self.numerator) + operand_names(self.denominator)
+
+    def value(self, panel, at):
+        return operand_value(self.numerator, panel, at) / operand_value(self.denominator, panel, at)
+
+
+def operand_names(operand):
+    if isinstance(operand, str):
+        return [operand]
+    if isinstance(operand, Ratio):
+        return operand.names()
+    return []
+
+
+def operand_value(operand, panel, at):
+    # value of operand at bar -at for every symbol (constants broadcast)
+    if isinstance(operand, str):
+        return panel[operand][:, -at]
+    if isinstance(operand, Ratio):
+        return operand.value(panel, at)
+    return operand
+
+
+class Compare:
+    # left op right, at bar -at (1 is the latest bar)
+    def __init__(self, left, op, right, at=1):
+        self.left = left
+        self.op = op
+        self.right = right
+        self.at = at
+
+    def names(self):
+        return operand_names(self.left) + operand_names(self.right)
+
+    def evaluate(self, panel):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return OPERATORS[self.op](operand_value(self.left, panel, self.at),
+                                      operand_value(self.right, panel, self.at))
+
+
+class Rule:
+    # condition name, true when every term is
+    def __init__(self, name, *terms):
+        self.name = name
+        self.terms = terms
+
+    def names(self):
+        return list(dict.fromkeys(name for term in self.terms for name in term.names()))
+
+    @property
+    def bars(self):
+        return max(term.at for term in self.terms)
+
+
+def crossover(name, fast, slow, lookback=2):
+    # fast was below slow lookback bars ago (counting the latest as 1) and is above it now
+    return Rule(name, Compare(fast, '<', slow, at=lookback), Compare(fast, '>', slow))
+
+
+def band(name, numerator, denominator, bounds):
+    # numerator / denominator within bounds, inclusive
+    ratio = Ratio(numerator, denominator)
+    return Rule(name, Compare(ratio, '>=', bounds[0]), Compare(ratio, '<=', bounds[1]))
+
+
+def above(name, left, right, at=1):
+    return Rule(name, Compare(left, '>', right, at=at))
+
+
+def below(name, left, right, at=1):
+    return Rule(name, Compare(left, '<', right, at=at))
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.names = list(dict.fromkeys(name for rule in self.rules for name in rule.names()))
+        self.bars = max((rule.bars for rule in self.rules), default=1)
+
+    def panel(self, data, signals):
+        """
+        data, signals: one TickStore / DataFrame and signals dict per symbol
+        Returns ({name: (symbols x bars) matrix}, {name: bool per symbol, the series exists},
+        bars of history per symbol)
+        """
+        n = len(data)
+        matrices = {name: np.full((n, self.bars), np.nan) for name in self.names}
+        present = {name: np.zeros(n, dtype=bool) for name in self.names}
+        lengths = np.zeros(n, dtype=np.int64)
+
+        for row, (symbol_data, symbol_signals) in enumerate(zip(data, signals)):
+            lengths[row] = len(symbol_data)
+            for name in self.names:
+                if name in symbol_signals:
+                    values = symbol_signals[name].to_numpy()
+                elif name in symbol_data:
+                    # TickStore hands out its column without building a Series
+                    values = symbol_data.column(name) if hasattr(symbol_data, 'column') else \
+                        symbol_data[name].to_numpy()
+                else:
+                    continue
+                values = values[-self.bars:]
+                if len(values):
+                    matrices[name][row, self.bars - len(values):] = values
+                present[name][row] = True
+
+        return matrices, present, lengths
+
+    def evaluate(self, data, signals):
+        # {rule name: bool per symbol} for the latest bar
+        matrices, present, lengths = self.panel(data, signals)
+        fired = {}
+        for rule in self.rules:
+            mask = lengths >= rule.bars
+            for name in rule.names():
+                mask &= present[name]
+            for term in rule.terms:
+                mask &= term.evaluate(matrices)
+            fired[rule.name] = mask
+        return fired
+
+    def apply(self, data, signals, conditions):
+        # sets conditions[i][rule name] = True for each symbol i a rule fires on, like a condition generator
+        for name, mask in self.evaluate(data, signals).items():
+            for row in np.flatnonzero(mask):
+                conditions[row][name] = True
@@ -0,0 +1,62 @@
+"""
+Fixed cadence evaluation
+
+Trader.receive_tick evaluates on every tick. CadenceScheduler stores ticks as they arrive and
+evaluates every interval seconds instead, aligned to the clock (a 300s interval evaluates at :00,
+:05, ...), the 5 minute loop seller.py describes. Only underlyings that got data since the
+previous evaluation are evaluated (Trader.dirty).
+
+It has Trader's receive_tick / receive_ticks, so it can stand in for the trader of a
+StreamPipeline:
+
+    scheduler = CadenceScheduler(trader, interval=5 * 60)
+    pipeline = StreamPipeline(scheduler)
+"""
+import asyncio
+import threading
+import time
+
+
+class CadenceScheduler:
+    def __init__(self, trader, interval=5 * 60, clock=time.time):
+        self.trader = trader
+        self.interval = interval
+        self.clock = clock
+        self.next_due = self._next_due(clock())
+        self.evaluations = 0
+        # ticks come from a pipeline's executor thread, run() evaluates from the event loop
+        self._lock = threading.Lock()
+
+    def _next_due(self, now):
+        return (now // self.interval + 1) * self.interval
+
+    def due(self):
+        return self.clock() >= self.next_due
+
+    def run_pending(self):
+        # evaluates if an interval boundary has passed, returns the orders sent
+        with self._lock:
+            now = self.clock()
+            if now < self.next_due:
+                return []
+            self.next_due = self._next_due(now)
+            self.evaluations += 1
+            return self.trader.evaluate()
+
+    def receive_tick(self, tick, update=True):
+        with self._lock:
+            self.trader.update_symbol(tick)
+        return self.run_pending() if update else []
+
+    def receive_ticks(self, ticks, update=True):
+        with self._lock:
+            for tick in ticks:
+                self.trader.update_symbol(tick)
+        return self.run_pending() if update else []
+
+    async def run(self):
+        # evaluates on cadence even when no ticks arrive, until cancelled
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(max(self.next_due - self.clock(), 0))
+            await loop.run_in_executor(None, self.run_pending)
@@ -1,5 +1,17 @@
 import pandas as pd
+import numpy as np
 import collections
+import functools
+
+from indicators import IndicatorEngine, Signals, get_engine
+from tick_store import TickStore
+from rules import RuleSet, crossover, band as within_band
+from instrumentation import REGISTRY as metrics, generator_name
+from order_book import OrderBookFeatures, has_quote, update_from_tick
+from volatility import VolatilityEngine
+from volume import VolumeEngine
+from news import NewsFeatures
+from symbols import SymbolRegistry, is_option
 
 """
 
@@ -44,12 +56,20 @@ def compute_ema(data, span):
     return ema
 
 
-def ema_sma_condition_generator(df, signals, conditions):
+EMA_SMA_WINDOWS = [5, 10, 50, 100, 250]
+VICINITY_BAND = (0.98, 1.02)
+LOOKBACK = 5
+REALIZED_VOLATILITY_WINDOW = 20
+RISK_FREE_RATE = 0.
+VOLUME_WINDOWS = [20, 50]
+
+
+def ema_sma_condition_generator(df, signals, conditions, band=VICINITY_BAND, lookback=LOOKBACK):
     # was below 200 EMA few days ago but today is above 200 EMA
     # possible long
     if (
         'EMA_200' in signals and
-        (signals['EMA_200'].iloc[-5] > df['close'].iloc[-5]) and
+        (signals['EMA_200'].iloc[-lookback] > df['close'].iloc[-lookback]) and
         (signals['EMA_200'].iloc[-1] < df['close'].iloc[-1])
        ):
         conditions['ema_200_cross_over'] = True
@@ -58,8 +78,8 @@ def ema_sma_condition_generator(df, signals, conditions):
     # possible long or at least alert
     if (
         'EMA_50' in signals and
-        ((signals['EMA_50'].iloc[-1] / df['close'].iloc[-1]) >= 0.98) and
-        ((signals['EMA_50'].iloc[-1] / df['close'].iloc[-1]) <= 1.02)
+        ((signals['EMA_50'].iloc[-1] / df['close'].iloc[-1]) >= band[0]) and
+        ((signals['EMA_50'].iloc[-1] / df['close'].iloc[-1]) <= band[1])
        ):
         conditions['ema_50_vicinity'] = True
 
@@ -73,44 +93,212 @@ def ema_sma_condition_generator(df, signals, conditions):
         conditions['ema_50_crosses_ema_200'] = True
 
 
-def ema_sma_signal_generator(data, signals):
-    for i in [5, 10, 50, 100, 250]:
+def ema_sma_signal_generator(data, signals, windows=EMA_SMA_WINDOWS):
+    def new_engine():
+        return IndicatorEngine(sma_windows=windows, ema_spans=windows,
+                               max_history=getattr(data, 'max_history', None))
+
+    key = 'ema_sma_{}'.format('_'.join(str(i) for i in windows))
+    engine = get_engine(signals, key, new_engine, data)
+    closes = data['close'].to_numpy()
+    # TickStore drops old rows once max_history is reached, total keeps counting
+    total = getattr(data, 'total', len(closes))
+    if total < engine.seen:
+        # history was replaced underneath us, start over
+        engine = new_engine()
+        signals.engines[key] = engine
+
+    # only feed the rows appended since the last tick
+    engine.update(closes[max(len(closes) - (total - engine.seen), 0):])
+    engine.seen = total
+
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    for i in windows:
         if len(data) < i:
             break
-        signals['SMA_{}'.format(i)] = compute_sma(data['close'], i)
-    for i in [5, 10, 50, 100, 250]:
+        signals['SMA_{}'.format(i)] = engine.series('SMA_{}'.format(i), index)
+    for i in windows:
         if len(data) < i:
             break
-        signals['EMA_{}'.format(i)] = compute_ema(data['close'], i)
+        signals['EMA_{}'.format(i)] = engine.series('EMA_{}'.format(i), index)
+
+
+# Vectorized counterparts, used by the backtester to evaluate a whole history in one pass.
+# signals[name] holds the full series, ready[name] the history length at which the streaming
+# generator would first have published it. Conditions come back as one bool per bar.
+
+def shift(values, periods):
+    shifted = np.full(len(values), np.nan)
+    if periods < len(values):
+        shifted[periods:] = values[:len(values) - periods]
+    return shifted
+
+
+def ema_sma_signal_arrays(close, signals, ready, windows=EMA_SMA_WINDOWS):
+    close = pd.Series(close)
+    length = 0
+    for i in windows:
+        length = max(length, i)
+        signals['SMA_{}'.format(i)] = compute_sma(close, i).to_numpy()
+        ready['SMA_{}'.format(i)] = length
+    length = 0
+    for i in windows:
+        length = max(length, i)
+        signals['EMA_{}'.format(i)] = compute_ema(close, i).to_numpy()
+        ready['EMA_{}'.format(i)] = length
+
+
+def ema_sma_condition_arrays(close, signals, ready, band=VICINITY_BAND, lookback=LOOKBACK):
+    length = np.arange(1, len(close) + 1)
+
+    def available(*names):
+        mask = np.ones(len(close), dtype=bool)
+        for name in names:
+            if name not in signals:
+                return None
+            mask &= length >= ready[name]
+        return mask
+
+    conditions = {}
+
+    mask = available('EMA_200')
+    if mask is not None:
+        ema_200 = signals['EMA_200']
+        conditions['ema_200_cross_over'] = mask & (length >= lookback) & \
+            (shift(ema_200, lookback - 1) > shift(close, lookback - 1)) & (ema_200 < close)
+
+    mask = available('EMA_50')
+    if mask is not None:
+        ratio = signals['EMA_50'] / close
+        conditions['ema_50_vicinity'] = mask & (ratio >= band[0]) & (ratio <= band[1])
+
+    mask = available('EMA_200', 'EMA_50')
+    if mask is not None:
+        ema_50, ema_200 = signals['EMA_50'], signals['EMA_200']
+        conditions['ema_50_crosses_ema_200'] = mask & (length >= 2) & \
+            (ema_50 > ema_200) & (shift(ema_50, 1) < shift(ema_200, 1))
+
+    return conditions
+
+
+def ema_sma_rules(band=VICINITY_BAND, lookback=LOOKBACK):
+    # ema_sma_condition_generator as rules, evaluated for every symbol at once
+    return RuleSet([
+        crossover('ema_200_cross_over', 'close', 'EMA_200', lookback=lookback),
+        within_band('ema_50_vicinity', 'EMA_50', 'close', band),
+        crossover('ema_50_crosses_ema_200', 'EMA_50', 'EMA_200'),
+    ])
+
+
+def order_book_signal_generator(data, signals):
+    # spread, mid and top of book size imbalance per row, recorded by Trader.update_symbol from the quotes
+    features = getattr(signals, 'engines', {}).get('order_book')
+    if features is None:
+        return
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    for name in features.NAMES:
+        signals[name] = features.series(name, index)
+
+
+def news_signal_generator(data, signals, news=None):
+    # sentiment of the symbol's recent news, read from news (a NewsService, see news.py) without
+    # blocking: the cache refreshes in the background once its news is older than the ttl (5m)
+    symbol = getattr(signals, 'symbol', None)
+    if news is None or symbol is None:
+        return
+    features = get_engine(signals, 'news', lambda: NewsFeatures(getattr(data, 'max_history', None)))
+    features.record(getattr(data, 'total', len(data)), news.lookup(symbol))
+
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    for name in features.NAMES:
+        signals[name] = features.series(name, index)
+
+
+def volatility_signal_generator(data, signals, window=REALIZED_VOLATILITY_WINDOW, rate=RISK_FREE_RATE):
+    # realized volatility of the underlying, IV and greeks of each of its option legs (see volatility.py),
+    # not in GENERATORS as every leg tick costs an IV solve
+    engine = get_engine(signals, 'volatility_{}'.format(window),
+                        lambda: VolatilityEngine(window, rate, getattr(data, 'max_history', None)))
+    updated = engine.update(data, getattr(signals, 'legs', {}))
+
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    signals['REALIZED_VOL'] = engine.realized.series(index)
+    for key in [key for key in signals if ':' in key and key.split(':', 1)[1] not in engine.legs]:
+        del signals[key]
+    # per leg series, aligned with the leg's data, are only rebuilt when the leg has new rows
+    for symbol in updated:
+        leg = engine.legs[symbol]
+        for name in leg.NAMES:
+            signals['{}:{}'.format(name, symbol)] = leg.series(name)
+
+
+def volume_signal_generator(data, signals, windows=VOLUME_WINDOWS, tz='EST'):
+    # session VWAP, rolling mean volume and relative volume by time of day (see volume.py)
+    def new_engine():
+        return VolumeEngine(windows, tz, getattr(data, 'max_history', None))
+
+    key = 'volume_{}_{}'.format('_'.join(str(i) for i in windows), tz)
+    engine = get_engine(signals, key, new_engine, data)
+    if getattr(data, 'total', len(data)) < engine.seen:
+        # history was replaced underneath us, start over
+        engine = new_engine()
+        signals.engines[key] = engine
+    engine.update(data)
+
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    for name in engine.names:
+        signals[name] = engine.series(name, index)
 
 
-def news_signal_generator(data, signals):
-    # if last fetch time was greater than threshold (5m)
-    #    fetch news, gather sentiment
-    pass
-
+GENERATORS = {
+    'signals': [ema_sma_signal_generator, order_book_signal_generator],
+    'conditions': [ema_sma_condition_generator]
+}
 
-def volatility_signal_generator(data, signals):
-    # implied vs. calculated volatility in the last few ticks
-    pass
+VECTORIZED_GENERATORS = {
+    'signals': [ema_sma_signal_arrays],
+    'conditions': [ema_sma_condition_arrays]
+}
 
 
-def volume_signal_generator(data, signals):
-    # generate moving average volume
-    pass
+# conditions from rules (see rules.py) instead of per symbol condition generators
+RULE_GENERATORS = {
+    'signals': [ema_sma_signal_generator, order_book_signal_generator],
+    'conditions': [],
+    'rules': ema_sma_rules()
+}
 
 
-GENERATORS = {
-    'signals': [ema_sma_signal_generator],
-    'conditions': [ema_sma_condition_generator]
-}
+def make_generators(windows=EMA_SMA_WINDOWS, band=VICINITY_BAND, lookback=LOOKBACK, vectorized=False,
+                    use_rules=False):
+    # GENERATORS / VECTORIZED_GENERATORS / RULE_GENERATORS with the EMA/SMA strategy parameters bound
+    if use_rules:
+        return {
+            'signals': [functools.partial(ema_sma_signal_generator, windows=list(windows)), order_book_signal_generator],
+            'conditions': [],
+            'rules': ema_sma_rules(tuple(band), lookback)
+        }
+    if vectorized:
+        return {
+            'signals': [functools.partial(ema_sma_signal_arrays, windows=list(windows))],
+            'conditions': [functools.partial(ema_sma_condition_arrays, band=tuple(band), lookback=lookback)]
+        }
+    return {
+        'signals': [functools.partial(ema_sma_signal_generator, windows=list(windows)), order_book_signal_generator],
+        'conditions': [functools.partial(ema_sma_condition_generator, band=tuple(band), lookback=lookback)]
+    }
 
 
 class Trader:
-    def __init__(self, client, initial_data = {}, generators=GENERATORS):
+    def __init__(self, client, initial_data = {}, generators=GENERATORS, max_history=None, feature_store=None):
         self.client = client
         self.symbols = {}
         self.generators = generators
+        self.max_history = max_history  # rows of history kept per symbol, None keeps everything
+        self.feature_store = feature_store  # FeatureStore the indicators' state persists in, optional
+        self.dirty = set()  # underlyings with data not evaluated yet
+        self.registry = SymbolRegistry()  # held symbols by underlying
+        self._order = {}
         for position in self.client.portfolio:
             symbol = position['symbol']
             underlying_symbol = position['underlyingSymbol']
@@ -118,9 +306,15 @@ class Trader:
             self.add_symbol(symbol,
                             initial_data[symbol] if symbol in initial_data else pd.DataFrame(),
                             position)
+            if not isinstance(underlying_symbol, str):
+                # NaN for stock positions, the symbol is its own underlying
+                continue
             self.add_symbol(underlying_symbol,
                             initial_data[underlying_symbol] if underlying_symbol in initial_data else pd.DataFrame(),
                             position)
+        self.link_legs()
+        if self.feature_store is not None:
+            self.warm_up()
 
         self.print_symbols()
 
@@ -146,86 +340,190 @@ class Trader:
                     print(pd.DataFrame.from_records([info[key]]).to_markdown())
 
     def add_symbol(self, symbol, data, position = None):
+        if not isinstance(data, TickStore):
+            data = TickStore.from_frame(data, max_history=self.max_history)
+
+        signals = Signals()
+        signals.symbol = symbol
+        signals.store = self.feature_store
         self.symbols[symbol] = {
             'position': position,
             'data': data,
-            'signals': {},
+            'signals': signals,
             'conditions': {}  # if any are true, send order { should_execute, order_type, quantity, reason }
         }
+        self._order.setdefault(symbol, len(self._order))
+        self.registry.add(symbol, position)
+        self.mark_dirty(symbol)
+
+    def remove_symbol(self, symbol):
+        info = self.symbols.pop(symbol, None)
+        self.registry.remove(symbol)
+        if info is not None and self.feature_store is not None:
+            self.feature_store.untrack(info['signals'])
+
+    def underlying_of(self, symbol):
+        return self.registry.underlying(symbol)
+
+    def mark_dirty(self, symbol):
+        # an option leg's tick re-evaluates its underlying
+        if symbol in self.symbols:
+            self.dirty.add(self.underlying_of(symbol))
+
+    def take_dirty(self):
+        # dirty underlyings in the order they were added, clears the set
+        dirty = sorted((symbol for symbol in self.dirty if symbol in self.symbols and not is_option(symbol)),
+                       key=self._order.get)
+        self.dirty = set()
+        return dirty
 
     def refresh_portfolio(self):
-        self.client.get_active_positions()
+        with metrics.timer('trader.refresh_portfolio'):
+            self.client.get_active_positions()
         self.print_positions()
 
         for position in self.client.portfolio:
             # populate symbols
             self.symbols[position['symbol']]['position'] = position
+        self.link_legs()
+
+    def link_legs(self):
+        # underlyings' signals carry their option legs, for generators that price them
+        for info in self.symbols.values():
+            info['signals'].legs = {}
+        for underlying, legs in self.registry.legs_by_underlying.items():
+            if underlying in self.symbols:
+                self.symbols[underlying]['signals'].legs = {
+                    symbol: self.symbols[symbol] for symbol in legs if is_option(symbol) and symbol in self.symbols}
 
     def update_symbol(self, tick):
         symbol = tick['symbol']
         if symbol in self.symbols:
-            self.symbols[symbol]['data'].append(tick)
-
-    def generate_signals(self):
-        for symbol in self.symbols.keys():
-            if '_' in symbol:
-                continue
-
+            with metrics.timer('trader.update_symbol'):
+                self.symbols[symbol]['data'].append(tick)
+                self.update_book(symbol, tick)
+                self.mark_dirty(symbol)
+
+    def update_book(self, symbol, tick):
+        # symbols get an order book with their first quote, from then on every row records its features
+        info = self.symbols[symbol]
+        features = info['signals'].engines.get('order_book')
+        if features is None:
+            if not has_quote(tick):
+                return
+            features = info['signals'].engines['order_book'] = OrderBookFeatures(self.max_history)
+        update_from_tick(features.book, tick)
+        features.record(info['data'].total)
+
+    def sell_price(self, symbol):
+        # limit price off the symbol's order book, None (market order) when it has no quotes
+        features = self.symbols[symbol]['signals'].engines.get('order_book')
+        return None if features is None else features.book.sell_price()
+
+    def _underlyings(self, symbols):
+        return [symbol for symbol in (self.symbols.keys() if symbols is None else symbols)
+                if symbol in self.symbols and not is_option(symbol)]
+
+    def generate_signals(self, symbols=None):
+        for symbol in self._underlyings(symbols):
             data = self.symbols[symbol]['data']
             signals = self.symbols[symbol]['signals']
 
             for signal_generator in self.generators['signals']:
-                signal_generator(data, signals)
+                with metrics.timer('generator.' + generator_name(signal_generator)):
+                    signal_generator(data, signals)
 
-    def build_conditions(self):
-        for symbol in self.symbols.keys():
-            if '_' in symbol:
-                continue
+    def build_conditions(self, symbols=None):
+        for symbol in self._underlyings(symbols):
             data = self.symbols[symbol]['data']
             signals = self.symbols[symbol]['signals']
             conditions = self.symbols[symbol]['conditions']
 
             for condition_generator in self.generators['conditions']:
-                condition_generator(data, signals, conditions)
-
-    def send_orders(self):
+                with metrics.timer('generator.' + generator_name(condition_generator)):
+                    condition_generator(data, signals, conditions)
+
+        # rules are checked across all the symbols in one pass
+        rule_set = self.generators.get('rules')
+        symbols = self._underlyings(symbols)
+        if rule_set is not None and symbols:
+            infos = [self.symbols[symbol] for symbol in symbols]
+            with metrics.timer('trader.rules'):
+                rule_set.apply([info['data'] for info in infos], [info['signals'] for info in infos],
+                               [info['conditions'] for info in infos])
+
+    def get_legs(self, underlying):
+        # symbols holding a position on underlying (the underlying itself for stock positions)
+        return self.registry.legs(underlying)
+
+    def send_orders(self, symbols=None):
         orders = []
 
-        for symbol in self.symbols.copy().keys():
-            if symbol not in self.symbols:
-                continue
-
+        for symbol in self._underlyings(symbols):
             conditions = self.symbols[symbol]['conditions']
             if len(conditions.keys()) > 0:
-                option_symbol = self.symbols[symbol]['position'][
-                    'symbol']  # position.symbol will always be option symbol
-
-                if option_symbol in self.symbols:
+                for option_symbol in self.get_legs(symbol):
                     orders.append((option_symbol, conditions))
 
         for symbol, conditions in orders:
-            underlying = self.symbols[symbol]['position']['underlyingSymbol']
+            underlying = self.registry.underlying(symbol)
 
-            print('-- SEND ORDER --', underlying, symbol, conditions)
+            limit_price = self.sell_price(symbol)
+            print('-- SEND ORDER --', underlying, symbol, limit_price, conditions)
 
-            self.client.sell_position(symbol)
-            del self.symbols[symbol]
+            self.client.sell_position(symbol, limit_price=limit_price)
+            self.remove_symbol(symbol)
 
-            if not any([
-                        option is not underlying and \
-                        option.split('_')[0] is underlying \
-                        for option in self.symbols.keys()
-                    ]):
-                del self.symbols[underlying]
+            if underlying in self.symbols and not self.registry.has_legs(underlying):
+                self.remove_symbol(underlying)
 
         return orders
 
-    def receive_tick(self, tick, update=True):
-        self.update_symbol(tick)
+    def warm_up(self):
+        # signals over the initial data alone, saved as is: a run starting from the same history loads them
+        self.generate_signals()
+        self.save_features()
+
+    def save_features(self):
+        # writes every stored engine that's ahead of its last saved version
+        return self.feature_store.save() if self.feature_store is not None else 0
+
+    def evaluate(self, symbols=None):
+        # symbols: underlyings to evaluate, by default the ones that received data since the last evaluation
+        if symbols is None:
+            symbols = self.take_dirty()
+        else:
+            symbols = self._underlyings(symbols)
+            self.dirty.difference_update(symbols)
+
+        metrics.count('trader.evaluated_symbols', len(symbols))
+        evaluated = [self.symbols[symbol]['signals'] for symbol in symbols]
+        with metrics.timer('trader.signals'):
+            self.generate_signals(symbols)
+        with metrics.timer('trader.conditions'):
+            self.build_conditions(symbols)
+        with metrics.timer('trader.send_orders'):
+            orders = self.send_orders(symbols)
+        metrics.count('trader.orders', len(orders))
+        if len(orders) > 0:
+            self.refresh_portfolio()
+        if self.feature_store is not None:
+            with metrics.timer('trader.feature_store'):
+                self.feature_store.flush(evaluated)
+
+        return orders
 
-        if update:
-            self.generate_signals()
-            self.build_conditions()
-            if len(self.send_orders()) > 0:
-                self.refresh_portfolio()
+    def receive_tick(self, tick, update=True):
+        metrics.count('trader.ticks')
+        with metrics.tick():
+            self.update_symbol(tick)
+            return self.evaluate() if update else []
+
+    def receive_ticks(self, ticks, update=True):
+        # a batch of ticks, evaluated once after all of them are applied
+        metrics.count('trader.ticks', len(ticks))
+        with metrics.tick('trader.batch'):
+            for tick in ticks:
+                self.update_symbol(tick)
+            return self.evaluate() if update else []
 
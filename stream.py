@@ -0,0 +1,258 @@
+"""
+Streaming ingestion
+
+TDFetcher.start_stream handed every level one message to a callback on the socket's own task, so
+a slow callback held up handle_message and nothing got to Trader. StreamPipeline sits between
+the two:
+
+    reader  --on_message-->  pending quotes + bounded queue  --run-->  Trader.receive_ticks
+
+- quotes wait in a bounded asyncio queue, a full queue makes the reader wait (backpressure)
+- a symbol is queued at most once: a quote for a symbol already waiting is merged into it, so under
+  load only the latest state of each symbol is evaluated
+- quotes are converted into the tick schema TickStore / Trader expect
+- the journal records every quote as it's read, before any merging, so it has the full stream
+- up to batch_size symbols are applied per evaluation, off the event loop
+- StreamMetrics tracks queue depth and latency
+
+fake_stream.py has a local stand-in for the TD stream to run it against.
+"""
+import asyncio
+import collections
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else None
+
+
+class StreamMetrics:
+    def __init__(self, window=10000):
+        self.received = 0   # quotes read off the stream
+        self.coalesced = 0  # quotes merged into one already waiting
+        self.ticks = 0      # ticks handed to the trader
+        self.batches = 0
+        self.depth = 0      # symbols waiting
+        self.max_depth = 0
+        self.latencies = collections.deque(maxlen=window)         # received -> evaluated, seconds
+        self.stream_latencies = collections.deque(maxlen=window)  # stream timestamp -> evaluated, seconds
+
+    def set_depth(self, depth):
+        self.depth = depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def summary(self):
+        def ms(value):
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            'received': self.received,
+            'coalesced': self.coalesced,
+            'ticks': self.ticks,
+            'batches': self.batches,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'latency_p50_ms': ms(percentile(self.latencies, 50)),
+            'latency_p99_ms': ms(percentile(self.latencies, 99)),
+            'stream_latency_p50_ms': ms(percentile(self.stream_latencies, 50)),
+            'stream_latency_p99_ms': ms(percentile(self.stream_latencies, 99)),
+        }
+
+
+class QuoteConverter:
+    """
+    Level one quote fields (as relabeled by tda-api) -> tick. Messages only carry the fields that
+    changed, so TOTAL_VOLUME is tracked per symbol and the tick's volume is the change since the
+    symbol's last tick.
+
+    Equity (QUOTE) and option (OPTION) quotes are both handled. Option quotes have no
+    TRADE_TIME_IN_LONG (their QUOTE_TIME / TRADE_TIME are seconds into the day), their ticks take
+    the message's timestamp.
+    """
+    # tick field -> level one field, the same in LevelOneEquityFields and LevelOneOptionFields
+    BOOK_FIELDS = {'bid': 'BID_PRICE', 'ask': 'ASK_PRICE', 'bid_size': 'BID_SIZE', 'ask_size': 'ASK_SIZE'}
+
+    def __init__(self, tz='EST'):
+        self.tz = tz
+        self.total_volume = {}
+
+    def price(self, quote):
+        last = quote.get('LAST_PRICE')
+        if last is not None:
+            return float(last)
+        bid, ask = quote.get('BID_PRICE'), quote.get('ASK_PRICE')
+        if bid is not None and ask is not None:
+            return (float(bid) + float(ask)) / 2
+        return None
+
+    def __call__(self, quote, timestamp=None):
+        # quote is every field seen for the symbol so far, None if it has no price yet
+        price = self.price(quote)
+        if price is None:
+            return None
+
+        symbol = quote['key']
+        millis = quote.get('TRADE_TIME_IN_LONG', timestamp)
+        total = quote.get('TOTAL_VOLUME')
+        previous = self.total_volume.get(symbol)
+        if total is not None:
+            self.total_volume[symbol] = total
+
+        tick = {
+            'symbol': symbol,
+            'datetime': pd.Timestamp(millis, unit='ms', tz='UTC').tz_convert(self.tz) if millis is not None
+            else pd.NaT,
+            'open': price,
+            'high': price,
+            'low': price,
+            'close': price,
+            'volume': float(total - previous) if total is not None and previous is not None else 0.,
+        }
+        for field, quote_field in self.BOOK_FIELDS.items():
+            tick[field] = quote.get(quote_field)
+        return tick
+
+
+class StreamPipeline:
+    def __init__(self, trader, maxsize=1024, batch_size=64, batch_window=0., tz='EST', metrics=None,
+                 clock=time.monotonic, journal=None, bars=None, news=None):
+        """
+        batch_size     most symbols applied per evaluation
+        batch_window   seconds to wait after the first symbol of a batch for others to arrive
+        journal        JournalWriter every quote read is recorded to as a tick, coalesced or not (see journal.py)
+        bars           BarAggregator every tick is added to (see bars.py)
+        news           NewsService refreshed in the background while the pipeline runs (see news.py)
+        """
+        self.trader = trader
+        self.queue = asyncio.Queue(maxsize)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.convert = QuoteConverter(tz)
+        self.metrics = metrics or StreamMetrics()
+        self.clock = clock
+        self.pending = {}  # symbol -> (quote fields, received at, stream timestamp)
+        self.quotes = {}   # symbol -> every quote field seen so far
+        self.journal = journal
+        self.journal_convert = QuoteConverter(tz)  # its own volume state, it sees every quote
+        self.journal_quotes = {}  # symbol -> every quote field seen so far
+        self.bars = bars
+        self.news = news
+
+    async def on_message(self, msg):
+        # level one handler: msg = {'timestamp': ms, 'content': [quote, ...], ...}
+        timestamp = msg.get('timestamp')
+        for quote in msg.get('content', []):
+            await self.put(quote, timestamp)
+        # a reader with data buffered never suspends, give the evaluator its turn
+        await asyncio.sleep(0)
+
+    async def put(self, quote, timestamp=None):
+        symbol = quote['key']
+        self.metrics.received += 1
+        if self.journal is not None:
+            self.record_quote(quote, timestamp)
+
+        if symbol in self.pending:
+            fields, received_at, _ = self.pending[symbol]
+            fields.update(quote)
+            # latency is kept from the oldest quote merged in
+            self.pending[symbol] = (fields, received_at, timestamp)
+            self.metrics.coalesced += 1
+            return
+
+        self.pending[symbol] = (dict(quote), self.clock(), timestamp)
+        await self.queue.put(symbol)
+        self.metrics.set_depth(self.queue.qsize())
+
+    def record_quote(self, quote, timestamp=None):
+        fields = self.journal_quotes.setdefault(quote['key'], {})
+        fields.update(quote)
+        tick = self.journal_convert(fields, timestamp)
+        if tick is not None:
+            self.journal.write(tick)
+
+    async def next_batch(self):
+        symbols = [await self.queue.get()]
+        if self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        while len(symbols) < self.batch_size and not self.queue.empty():
+            symbols.append(self.queue.get_nowait())
+        self.metrics.set_depth(self.queue.qsize())
+        return [self.pending.pop(symbol) for symbol in symbols]
+
+    def to_ticks(self, batch):
+        ticks = []
+        for fields, _, timestamp in batch:
+            quote = self.quotes.setdefault(fields['key'], {})
+            quote.update(fields)
+            tick = self.convert(quote, timestamp)
+            if tick is not None:
+                ticks.append(tick)
+                if self.bars is not None:
+                    self.bars.update(tick)
+        return ticks
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            try:
+                ticks = self.to_ticks(batch)
+                if ticks:
+                    # evaluated off the loop so the reader keeps draining the socket
+                    await loop.run_in_executor(None, self.trader.receive_ticks, ticks)
+                self.record(batch, len(ticks))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def record(self, batch, n_ticks):
+        done = self.clock()
+        now_ms = time.time() * 1000
+        self.metrics.ticks += n_ticks
+        self.metrics.batches += 1
+        for _, received_at, timestamp in batch:
+            self.metrics.latencies.append(done - received_at)
+            if timestamp is not None:
+                self.metrics.stream_latencies.append((now_ms - timestamp) / 1000)
+
+    async def drain(self):
+        await self.queue.join()
+        if self.journal is not None:
+            self.journal.flush()
+        # indicator state too, a restart picks up from it (feature_store.py)
+        save_features = getattr(self.trader, 'save_features', None)
+        if save_features is not None:
+            await asyncio.get_running_loop().run_in_executor(None, save_features)
+
+
+async def consume(stream_client, pipeline):
+    """
+    Reads stream_client (its level one handler already set to pipeline.on_message) until it closes,
+    with the pipeline evaluating alongside. Quotes already read are evaluated before returning.
+    """
+    evaluator = asyncio.ensure_future(pipeline.run())
+    news = asyncio.ensure_future(pipeline.news.run()) if pipeline.news is not None else None
+    try:
+        while True:
+            await stream_client.handle_message()
+    except (EOFError, ConnectionError):
+        pass
+    finally:
+        if not evaluator.done():
+            drained = asyncio.ensure_future(pipeline.drain())
+            await asyncio.wait([evaluator, drained], return_when=asyncio.FIRST_COMPLETED)
+            drained.cancel()
+        for task in (evaluator, news):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    return pipeline.metrics
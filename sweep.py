@@ -0,0 +1,114 @@
+"""
+Parameter sweep
+
+Runs the vectorized backtest over a grid of EMA/SMA strategy parameters:
+
+    windows   EMA/SMA windows published as signals
+    band      the EMA_50 vicinity band (0.98, 1.02)
+    lookback  bars back for the EMA_200 cross over (iloc[-5])
+
+Every (position x parameter set) pair is one job on a process pool. Price arrays are packed once
+into a single shared memory block that workers attach to, jobs only carry a plan dict and the
+parameters. The result is one row per parameter set, ranked by total P/L.
+"""
+import concurrent.futures
+import itertools
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import plan_positions, evaluate_leg, build_results
+from seller import make_generators, EMA_SMA_WINDOWS, VICINITY_BAND, LOOKBACK
+
+_arrays = None  # worker side views into the shared block
+_block = None
+
+
+def param_grid(windows=(EMA_SMA_WINDOWS,), band=(VICINITY_BAND,), lookback=(LOOKBACK,)):
+    return [{'windows': list(w), 'band': tuple(b), 'lookback': l}
+            for w, b, l in itertools.product(windows, band, lookback)]
+
+
+class SharedArrays:
+    """
+    Named 1-D arrays packed into one shared memory block.
+
+    spec maps name -> (offset, length, dtype) and is all another process needs to attach.
+    """
+    def __init__(self, arrays):
+        self.spec, offset = {}, 0
+        for name, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            offset = -(-offset // values.dtype.itemsize) * values.dtype.itemsize
+            self.spec[name] = (offset, len(values), values.dtype.str)
+            offset += values.nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, (start, length, dtype) in self.spec.items():
+            np.ndarray(length, dtype=dtype, buffer=self.shm.buf, offset=start)[:] = arrays[name]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach(name, spec):
+    block = shared_memory.SharedMemory(name=name)
+    arrays = {key: np.ndarray(length, dtype=dtype, buffer=block.buf, offset=start)
+              for key, (start, length, dtype) in spec.items()}
+    return block, arrays
+
+
+def _init_worker(name, spec):
+    global _arrays, _block
+    _block, _arrays = attach(name, spec)
+
+
+def _run_job(job):
+    plan, params_id, params = job
+    generators = make_generators(vectorized=True, **params)
+    return plan['symbol'], params_id, evaluate_leg(plan, _arrays, generators)
+
+
+def summarize(positions, fills_by_params, grid):
+    rows = []
+    for params_id, params in enumerate(grid):
+        results = build_results(positions, fills_by_params.get(params_id, {}))
+        rows.append({
+            'windows': ','.join(str(i) for i in params['windows']),
+            'band_low': params['band'][0],
+            'band_high': params['band'][1],
+            'lookback': params['lookback'],
+            'positions': len(results),
+            'sold': int(results['sold'].sum()),
+            'total_pnl': results['pnl'].sum(skipna=True),
+            'mean_pnl': results['pnl'].mean(skipna=True),
+        })
+
+    table = pd.DataFrame.from_records(rows)
+    return table.sort_values('total_pnl', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def run_sweep(positions, initial_data, ticks, grid, max_workers=None, chunksize=16):
+    arrays, plans = plan_positions(positions, initial_data, ticks)
+    jobs = [(plan, params_id, params) for params_id, params in enumerate(grid) for plan in plans]
+
+    shared = SharedArrays(arrays)
+    fills_by_params = {}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                    initializer=_init_worker,
+                                                    initargs=(shared.name, shared.spec)) as executor:
+            for symbol, params_id, fill in executor.map(_run_job, jobs, chunksize=chunksize):
+                if fill is not None:
+                    fills_by_params.setdefault(params_id, {})[symbol] = fill
+    finally:
+        shared.close()
+
+    return summarize(positions, fills_by_params, grid)
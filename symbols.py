@@ -0,0 +1,111 @@
+"""
+Symbols
+
+Option symbols look like AMD_031921C92.5 (underlying, expiry MMDDYY, C / P, strike). contract()
+parses a symbol once into a Contract and hands back the same record from then on, its strings
+interned, so checking whether a symbol is an option or finding its underlying / strike is an
+attribute read rather than a string split.
+
+SymbolRegistry is Trader's index of the symbols it holds positions in, by underlying: the legs of
+an underlying (the underlying itself for stock positions) are an O(1) lookup, and so is removing
+one when it's sold.
+"""
+import collections
+import re
+import sys
+from datetime import datetime
+
+OPTION_SYMBOL = re.compile(r'^(.+)_(\d{6})([CP])(\d+(?:\.\d+)?)$')
+
+
+class Contract:
+    __slots__ = ('symbol', 'underlying', 'expiration', 'strike', 'put_call', 'is_option')
+
+    def __init__(self, symbol, underlying, expiration=None, strike=None, put_call=None, is_option=False):
+        self.symbol = symbol
+        self.underlying = underlying
+        self.expiration = expiration  # datetime.date
+        self.strike = strike
+        self.put_call = put_call  # 'CALL' / 'PUT'
+        self.is_option = is_option
+
+    def __repr__(self):
+        return 'Contract({!r})'.format(self.symbol)
+
+
+_contracts = {}
+
+
+def parse(symbol):
+    match = OPTION_SYMBOL.match(symbol)
+    if match is None:
+        # not an option, or one in a format we don't know: anything with an underscore is an option
+        underlying = symbol.split('_', 1)[0]
+        return Contract(symbol, sys.intern(underlying), is_option=underlying != symbol)
+    underlying, expiration, put_call, strike = match.groups()
+    return Contract(symbol, sys.intern(underlying), datetime.strptime(expiration, '%m%d%y').date(), float(strike),
+                    'CALL' if put_call == 'C' else 'PUT', True)
+
+
+def contract(symbol):
+    if not isinstance(symbol, str):
+        # NaN / None where a position has no underlying, never an option
+        return Contract(symbol, symbol)
+    record = _contracts.get(symbol)
+    if record is None:
+        symbol = sys.intern(symbol)
+        record = _contracts[symbol] = parse(symbol)
+    return record
+
+
+def is_option(symbol):
+    return contract(symbol).is_option
+
+
+def option_symbol(underlying, expiration, strike, put_call):
+    # AMD, date, 92.5, 'CALL' -> AMD_031921C92.5
+    strike = '{:f}'.format(strike).rstrip('0').rstrip('.')
+    return '{}_{}{}{}'.format(underlying.upper(), expiration.strftime('%m%d%y'), put_call[0].upper(), strike)
+
+
+def from_description(description):
+    # TD's option description, 'AMD Mar 19 2021 92.5 Call', as a Contract
+    underlying, month, day, year, strike, put_call = description.split(' ')
+    expiration = datetime.strptime('{} {} {}'.format(month, day, year), '%b %d %Y')
+    return contract(option_symbol(underlying, expiration, float(strike), put_call))
+
+
+class SymbolRegistry:
+    def __init__(self):
+        self.legs_by_underlying = collections.defaultdict(dict)  # underlying -> {held symbol: None}, in order added
+        self.underlyings = {}  # held symbol -> underlying
+
+    def add(self, symbol, position=None):
+        # a position held in symbol makes it a leg of the position's underlying
+        if position is None or position['symbol'] != symbol or symbol in self.underlyings:
+            return
+        underlying = position.get('underlyingSymbol') or contract(symbol).underlying
+        if underlying != underlying:  # NaN for stock positions
+            underlying = symbol
+        self.underlyings[symbol] = underlying
+        self.legs_by_underlying[underlying][symbol] = None
+
+    def remove(self, symbol):
+        underlying = self.underlyings.pop(symbol, None)
+        if underlying is not None:
+            legs = self.legs_by_underlying[underlying]
+            legs.pop(symbol, None)
+            if not legs:
+                del self.legs_by_underlying[underlying]
+
+    def legs(self, underlying):
+        legs = self.legs_by_underlying.get(underlying)
+        return list(legs) if legs else []
+
+    def has_legs(self, underlying):
+        return underlying in self.legs_by_underlying
+
+    def underlying(self, symbol):
+        # the underlying of a held symbol, otherwise parsed from the symbol
+        underlying = self.underlyings.get(symbol)
+        return underlying if underlying is not None else contract(symbol).underlying
@@ -13,17 +13,37 @@ later (1m, -4-5months):
 > Return DF with same schema as options quote on TD API
 
 """
+import functools
 import pandas as pd
-from data_fetcher import TDFetcher, RobinFetcher
-from client import TdAccount
-from utils import string_to_date, get_option_symbol, filter_df_by_date, TRANSACTIONS_COPY
-from seller import Trader
+from client import TdAccount, make_loader
+from utils import string_to_date, get_option_symbol, TRANSACTIONS_COPY
+from backtest import run_vectorized, replay, total_pnl
+from sweep import run_sweep, param_grid
+from loader import stock_request, option_request
+from symbols import from_description
+from history import History
+from feature_store import FeatureStore
 
 pd.set_option('mode.chained_assignment', None)
 
-td_client = TdAccount()
-td_fetcher = TDFetcher(td_client.client)
-robin_fetcher = RobinFetcher()
+# 'vectorized' evaluates each history in one pass, 'replay' feeds every tick through Trader (reference),
+# 'sweep' runs the vectorized backtest over SWEEP_GRID on a process pool
+MODE = 'vectorized'
+
+# indicator state replay mode picks up from instead of recomputing it over the training history
+FEATURE_STORE_DIR = './cache/features/'
+
+SWEEP_GRID = param_grid(windows=[[5, 10, 50, 100, 250], [10, 50, 200], [20, 50, 200]],
+                        band=[(0.98, 1.02), (0.99, 1.01), (0.97, 1.03)],
+                        lookback=[3, 5, 10])
+
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    # TD account and history loader, created on first use rather than on import
+    td_client = TdAccount()
+    return td_client, make_loader(td_client)
+
 
 def get_positions():
     # transactions = td_client.get_transactions().copy()
@@ -31,47 +51,47 @@ def get_positions():
     # transactions = transactions[transactions['positionEffect'] == 'OPENING'][transactions['optionExpirationDate'] > '2020-10-26T06:00:00+0000'].head(5)
     # print(transactions)
     # return transactions
+    td_client, _ = get_session()
     return td_client.get_active_positions().copy().head(3)
 
 
-def get_train_test_data_option(option):
+def get_requests(option):
+    # underlying -1 year (train=-1year to date of purchase, test=purchase date to now)
+    # option -4months (or as far back as possible)
     exp = string_to_date(option['optionExpirationDate']).strftime('%Y-%m-%d')
-    strike = float(option['description'].split(" ")[-2])
-    data = robin_fetcher.get_historical_options(option['underlyingSymbol'], exp, strike)
-    train_data = filter_df_by_date(data, from_date='2019-01-01', to_date=option['settlementDate'])
-    test_data = filter_df_by_date(data, from_date=option['settlementDate'])
-    option_symbol = get_option_symbol(option)
-    test_data['symbol'], train_data['symbol'] = option_symbol, option_symbol
-    return train_data, test_data
-
-
-def get_train_test_data_stock(option):
-    data = td_fetcher.get_historical_stock(option['underlyingSymbol'])
-    train_data = filter_df_by_date(data, from_date='2019-01-01', to_date=option['settlementDate'])
-    test_data = filter_df_by_date(data, from_date=option['settlementDate'])
-    test_data['symbol'], train_data['symbol'] = option['underlyingSymbol'], option['underlyingSymbol']
-    return train_data, test_data
-
-
-def get_data(option):
-    # get train,test underlying -1 year (train=-1year to date of purchase, test=purchase date to now)
-    underlying_data = get_train_test_data_stock(option)
+    strike = from_description(option['description']).strike
+    return (stock_request(option['underlyingSymbol'], max_age=24 * 60 * 60),
+            option_request(option['underlyingSymbol'], exp, strike))
 
-    # get train,test option -4months (or as far back as possible)
-    option_data = get_train_test_data_option(option)
 
-    return underlying_data, option_data
+def split_train_test(history, option, symbol):
+    # the split views share history's frame with every position on the same underlying, assign copies
+    train_data, test_data = history.split(at=option['settlementDate'], from_date='2019-01-01')
+    return train_data.assign(symbol=symbol), test_data.assign(symbol=symbol)
 
 
 def get_test_data():
+    positions = get_positions()
+
+    requests = {}
+    for idx, buy in positions.iterrows():
+        requests[(idx, 'underlying')], requests[(idx, 'option')] = get_requests(buy)
+    _, loader = get_session()
+    data = loader.load(requests)
+    # keys sharing a request share the DataFrame, index it once
+    histories = {}
+    for key, df in data.items():
+        if id(df) not in histories:
+            histories[id(df)] = History(df)
+        data[key] = histories[id(df)]
+
     initial_data = {}
     ticks = {} # [ [aapl_tick1, aapl_tick2], [xyz_tick1, xyz_tick2] ]
-    for idx, buy in get_positions().iterrows():
-        underlying, option = get_data(buy)
+    for idx, buy in positions.iterrows():
         underlying_symbol = buy['underlyingSymbol']
         option_symbol = get_option_symbol(buy)
-        underlying_train, underlying_test = underlying
-        option_train, option_test = option
+        underlying_train, underlying_test = split_train_test(data[(idx, 'underlying')], buy, underlying_symbol)
+        option_train, option_test = split_train_test(data[(idx, 'option')], buy, option_symbol)
         initial_data[option_symbol], initial_data[underlying_symbol] = option_train, underlying_train
         ticks[option_symbol], ticks[underlying_symbol] = option_test, underlying_test
 
@@ -79,46 +99,23 @@ def get_test_data():
     return initial_data, ticks
 
 
-class MockClient:
-    def __init__(self, positions):
-        self.td_client = {}
-        self.positions = positions
-        self.portfolio = None
-        self.portfolio_df = None
-        self.get_active_positions()
-
-    def get_active_positions(self):
-        # start with all buys, remove
-        self.portfolio_df = self.positions
-        self.portfolio = self.portfolio_df.to_dict(orient='records')
-
-        return self.portfolio_df
-
-    def sell_position(self, symbol):
-        self.positions = self.positions[self.positions['symbol'] != symbol]
-        self.get_active_positions()
-
-
-initial_data, ticks = get_test_data()
-client = MockClient(positions=get_positions())
-trader = Trader(client=client, initial_data=initial_data)
-
-# print('-- ticks -- ', ticks)
-def begin_ticks(ticks):
-    symbols = list(ticks.keys())
-    num_ticks = max([ticks[symbols[i]].shape[0] for i in range(len(symbols))])
-
-    for idx in range(num_ticks):
-        for symbol in symbols:
-            df = ticks[symbol]
-            if idx < len(df):
-                tick = df.iloc[idx]
-                should_update = '_' not in symbol
-                trader.receive_tick(tick, should_update)
+def backtest(mode=MODE):
+    initial_data, ticks = get_test_data()
+    positions = get_positions()
+    if mode == 'sweep':
+        ranked = run_sweep(positions, initial_data, ticks, SWEEP_GRID)
+        print('-- SWEEP --\n', ranked.to_markdown())
+        return ranked
 
-    print('-- FINAL SYMBOLS -- ')
-    trader.print_symbols()
+    if mode == 'replay':
+        results = replay(positions, initial_data, ticks, feature_store=FeatureStore(FEATURE_STORE_DIR))
+    else:
+        results = run_vectorized(positions, initial_data, ticks)
 
+    print('-- RESULTS ({}) --\n'.format(mode), results.to_markdown())
+    print('-- TOTAL P/L --', total_pnl(results))
+    return results
 
-begin_ticks(ticks)
 
+if __name__ == '__main__':
+    backtest()
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from columnar import read_frame, write_frame
+
+
+def test_datetime_index_round_trips(tmp_path):
+    path = str(tmp_path / 'frame.col')
+    index = pd.date_range('2021-03-19 09:30', periods=5, freq='min', tz='EST', name='datetime')
+    df = pd.DataFrame({'close': np.arange(5.), 'volume': np.arange(5) * 100}, index=index)
+
+    write_frame(df, path)
+
+    result = read_frame(path)
+    assert str(result.index.tz) == 'EST' and result.index.name == 'datetime'
+    pd.testing.assert_frame_equal(result, df, check_freq=False, check_index_type=False)
+
+
+def test_integer_and_label_indexes_round_trip(tmp_path):
+    path = str(tmp_path / 'frame.col')
+    for index in (pd.Index([3, 1, 2]), pd.Index(['a', 'b', 'c'], name='key')):
+        df = pd.DataFrame({'close': [1., 2., 3.]}, index=index)
+        write_frame(df, path)
+        pd.testing.assert_frame_equal(read_frame(path), df)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from feature_store import FeatureStore
+from indicators import Signals
+from seller import ema_sma_signal_generator
+from tick_store import TickStore
+
+
+def history(n=300):
+    return pd.DataFrame({'datetime': pd.date_range('2021-01-04 09:30', periods=n, freq='min', tz='EST'),
+                         'close': 100 + np.sin(np.arange(n) / 10.)})
+
+
+def run(store, data):
+    signals = Signals()
+    signals.symbol = 'AMD'
+    signals.store = store
+    ema_sma_signal_generator(data, signals, windows=[10])
+    store.save()
+    return signals
+
+
+def test_changed_older_row_misses(tmp_path):
+    data = history()
+    run(FeatureStore(str(tmp_path)), data)
+
+    store = FeatureStore(str(tmp_path))
+    run(store, data)
+    assert (store.hits, store.misses) == (1, 0)
+
+    changed = data.copy()
+    changed.loc[10, 'close'] += 1
+    store = FeatureStore(str(tmp_path))
+    signals = run(store, changed)
+    assert (store.hits, store.misses) == (0, 1)
+    expected = changed['close'].ewm(span=10, adjust=False).mean()
+    assert np.allclose(signals['EMA_10'].to_numpy(), expected.to_numpy())
+
+
+def test_flush_writes_only_the_signals_given(tmp_path):
+    store = FeatureStore(str(tmp_path), min_new_rows=1)
+    rows = history(400)
+    stores = [TickStore.from_frame(rows.iloc[:300]), TickStore.from_frame(rows.iloc[:300])]
+    first, second = (run(store, data) for data in stores)
+    for signals, data in zip((first, second), stores):
+        data.extend(rows.iloc[300:])
+        ema_sma_signal_generator(data, signals, windows=[10])
+
+    assert store.flush([first]) == 1
+    store.untrack(second)
+    assert store.flush() == 0
@@ -0,0 +1,41 @@
+import threading
+
+from loader import HistoryLoader, option_request, stock_request
+
+
+class StockFetcher:
+    def __init__(self, options_done):
+        self.options_done = options_done
+        self.lock = threading.Lock()
+        self.running = self.most_running = 0
+
+    def get_historical_stock(self, symbol):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        # stock requests only finish once the option one got its turn
+        done = self.options_done.wait(timeout=5)
+        with self.lock:
+            self.running -= 1
+        return done
+
+
+class OptionFetcher:
+    def __init__(self, options_done):
+        self.options_done = options_done
+
+    def get_historical_options(self, underlying, **params):
+        self.options_done.set()
+        return True
+
+
+def test_a_burst_for_one_source_does_not_hold_up_another():
+    options_done = threading.Event()
+    stocks = StockFetcher(options_done)
+    loader = HistoryLoader({'td': stocks, 'rh': OptionFetcher(options_done)}, limits={'td': 2, 'rh': 1})
+    requests = [stock_request('S{}'.format(i)) for i in range(64)] + [option_request('AMD', '2021-03-19', 92.5)]
+
+    results = loader.load_requests(requests)
+
+    assert all(results.values())
+    assert stocks.most_running <= 2
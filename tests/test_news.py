@@ -0,0 +1,68 @@
+import asyncio
+
+from news import NewsService, LexiconScorer
+
+
+class ListSource:
+    def __init__(self, items):
+        self.items = items
+
+    async def fetch(self, symbol):
+        return list(self.items.get(symbol, []))
+
+
+class FlakyScorer:
+    # raises on its first call only
+    def __init__(self):
+        self.calls = 0
+        self.scorer = LexiconScorer()
+
+    def __call__(self, texts):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError('scorer down')
+        return self.scorer(texts)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+async def settle(service):
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if not service.pending:
+            return
+
+
+def test_refresh_survives_scorer_and_item_errors():
+    clock = Clock()
+    source = ListSource({'AMD': [{'headline': 'AMD shares surge on record profit'}], 'BAD': ['not a dict']})
+    service = NewsService(source, FlakyScorer(), ttl=60, clock=clock)
+
+    async def scenario():
+        runner = asyncio.ensure_future(service.run())
+        await asyncio.sleep(0)
+        try:
+            assert service.lookup('AMD') is None
+            await settle(service)
+            failed = service.cache.get('AMD')
+            assert failed.error is not None and failed.items == []
+
+            # the loop is still running: after ttl the next lookup refreshes and scores
+            clock.now += 61
+            service.lookup('AMD')
+            service.lookup('BAD')
+            await settle(service)
+            assert service.loop is not None and not runner.done()
+            entry = service.cache.get('AMD')
+            assert entry.error is None and entry.sentiment > 0
+            assert service.cache.get('BAD').error is not None
+        finally:
+            runner.cancel()
+
+    asyncio.run(scenario())
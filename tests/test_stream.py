@@ -0,0 +1,67 @@
+import asyncio
+
+import pandas as pd
+
+from fake_stream import FakeStreamServer, FakeStreamClient
+from journal import JournalWriter, read_records
+from mock_broker import MockClient
+from seller import Trader
+from stream import StreamPipeline, consume
+
+LEG = 'AMD_031921C92.5'
+
+
+def sell_once_quoted(books):
+    # condition generator firing once every leg of the underlying has an order book
+    def generator(data, signals, conditions):
+        features = [info['signals'].engines.get('order_book') for info in signals.legs.values()]
+        if features and all(feature is not None for feature in features):
+            books.extend(feature.book for feature in features)
+            conditions['quoted'] = True
+    return generator
+
+
+async def stream(trader, client, n_messages=500):
+    server = FakeStreamServer(client.get_portfolio_tickers() + client.get_option_tickers(), n_messages)
+    host, port = await server.start()
+    stream_client = FakeStreamClient(host, port)
+    await stream_client.login()
+    pipeline = StreamPipeline(trader)
+    stream_client.add_level_one_equity_handler(pipeline.on_message)
+    stream_client.add_level_one_option_handler(pipeline.on_message)
+    await consume(stream_client, pipeline)
+    await server.stop()
+
+
+def test_option_leg_sells_at_book_price():
+    positions = pd.DataFrame([{'symbol': LEG, 'underlyingSymbol': 'AMD', 'averagePrice': 1.,
+                               'longQuantity': 1, 'shortQuantity': 0}])
+    client = MockClient(positions)
+    books = []
+    trader = Trader(client, generators={'signals': [], 'conditions': [sell_once_quoted(books)]})
+
+    asyncio.run(stream(trader, client))
+
+    assert LEG in client.fills
+    book = books[0]
+    price = client.fills[LEG]['price']
+    assert price is not None and price == book.sell_price()
+    assert book.best_bid[0] <= price <= book.best_ask[0]
+
+
+def test_journal_keeps_coalesced_quotes(tmp_path):
+    path = str(tmp_path / 'session.tj')
+    quotes = [{'key': 'AMD', 'LAST_PRICE': 90. + i, 'TOTAL_VOLUME': 100 * i} for i in range(5)]
+
+    async def put_all(pipeline):
+        for i, quote in enumerate(quotes):
+            await pipeline.put(quote, 1616166000000 + i)
+        return pipeline.to_ticks(await pipeline.next_batch())
+
+    with JournalWriter(path) as journal:
+        ticks = asyncio.run(put_all(StreamPipeline(None, journal=journal)))
+
+    records = read_records(path)
+    assert len(ticks) == 1 and ticks[0]['close'] == 94.
+    assert list(records['close']) == [90., 91., 92., 93., 94.]
+    assert list(records['volume']) == [0., 100., 100., 100., 100.]
@@ -0,0 +1,23 @@
+import numpy as np
+
+from tick_store import RingBuffer
+
+
+def test_bounded_buffer_slides_once_every_maxlen_appends(monkeypatch):
+    calls = []
+    make_room = RingBuffer._make_room
+    monkeypatch.setattr(RingBuffer, '_make_room', lambda self, n: calls.append(n) or make_room(self, n))
+
+    buffer = RingBuffer(np.float64, capacity=1024, maxlen=1023)
+    for i in range(20000):
+        buffer.append(i)
+
+    assert len(calls) <= 20000 // 1023 + 1
+    assert len(buffer) == 1023 and buffer.total == 20000
+    assert (buffer.view() == np.arange(20000 - 1023, 20000)).all()
+
+
+def test_bounded_buffer_grows_as_it_fills():
+    buffer = RingBuffer(np.float64, capacity=16, maxlen=10 ** 6)
+    buffer.extend(np.arange(100.))
+    assert len(buffer._buf) == 128
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from mock_broker import MockClient
+from seller import Trader
+from symbols import contract, is_option
+
+LEG = 'AMD_031921C92.5'
+
+
+def test_trader_over_stock_and_option_positions():
+    positions = pd.DataFrame([
+        {'symbol': 'MSFT', 'underlyingSymbol': np.nan, 'averagePrice': 230., 'longQuantity': 10, 'shortQuantity': 0},
+        {'symbol': LEG, 'underlyingSymbol': 'AMD', 'averagePrice': 1., 'longQuantity': 1, 'shortQuantity': 0},
+    ])
+    trader = Trader(MockClient(positions), generators={'signals': [], 'conditions': []})
+
+    assert set(trader.symbols) == {'MSFT', LEG, 'AMD'}
+    assert trader.get_legs('MSFT') == ['MSFT'] and trader.get_legs('AMD') == [LEG]
+    assert trader.take_dirty() == ['MSFT', 'AMD']
+
+
+def test_non_str_symbols_are_not_options():
+    assert not is_option(np.nan) and not is_option(None)
+    assert not contract(np.nan).is_option
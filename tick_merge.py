@@ -0,0 +1,104 @@
+"""
+Timestamp ordered tick merge
+
+Replays used to walk the ticks frames by row index, one row of every symbol at a time, so a 5
+minute option bar and a 1 minute stock bar with the same row number were replayed together and
+every frame had to be in memory. merge_ticks() instead heap-merges any number of sources by
+timestamp and yields tick dicts, ties going to the source listed first, then to row order:
+
+    for tick in merge_ticks({'AMD': df, 'AMD_031921C92.5': 'cache/AMD_92.5_call.col', 'live': 'day.tj'}):
+        trader.receive_tick(tick)
+
+A source is a DataFrame, a .col file (columnar.py), a tick journal (journal.py) or any iterable of
+DataFrame chunks, each already in time order. Sources are read lazily chunk_rows at a time, files
+through their memory map, so memory is bounded by sources x chunk_rows whatever the length of the
+replay. Ticks without a symbol get the one their source is keyed by, rows without a datetime
+sort before everything else.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import journal
+from tick_store import to_utc_ns
+
+CHUNK_ROWS = 4096
+NAT = np.iinfo(np.int64).min
+
+
+def frame_chunks(df, chunk_rows=CHUNK_ROWS):
+    # views, nothing is copied
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def columnar_chunks(path, chunk_rows=CHUNK_ROWS):
+    header = columnar.read_header(path)
+    arrays = columnar.read_columns(path)
+    names = [column['name'] for column in header['columns'] if column['name'] != columnar.INDEX_COLUMN]
+    tz = {column['name']: column.get('tz') for column in header['columns'] if column.get('datetime')}
+    for start in range(0, header['rows'], chunk_rows):
+        chunk = {}
+        for name in names:
+            values = arrays[name][start:start + chunk_rows]
+            if name in tz:
+                values = pd.DatetimeIndex(values)
+                values = values.tz_localize('UTC').tz_convert(tz[name]) if tz[name] else values
+            chunk[name] = values
+        yield pd.DataFrame(chunk, columns=names, copy=False)
+
+
+def journal_chunks(path, chunk_rows=CHUNK_ROWS):
+    header, _ = journal.read_header(path)
+    records = journal.read_records(path)
+    symbols = np.array(journal.read_symbols(path), dtype=object)
+    for start in range(0, len(records), chunk_rows):
+        chunk = records[start:start + chunk_rows]
+        df = pd.DataFrame({field: chunk[field] for field in journal.FIELDS})
+        df.insert(0, 'datetime', pd.DatetimeIndex(chunk['ts'].view('M8[ns]')).tz_localize('UTC').tz_convert(header['tz']))
+        df.insert(0, 'symbol', symbols[chunk['symbol']])
+        yield df
+
+
+def chunks(source, chunk_rows=CHUNK_ROWS):
+    if isinstance(source, pd.DataFrame):
+        return frame_chunks(source, chunk_rows)
+    if isinstance(source, str):
+        if source.endswith(journal.EXT):
+            return journal_chunks(source, chunk_rows)
+        return columnar_chunks(source, chunk_rows)
+    return source
+
+
+def _keyed(rank, source, symbol, chunk_rows):
+    # (ts ns UTC, rank, row, tick) for every row of a source, the key is unique so ticks never get compared
+    row = 0
+    for chunk in chunks(source, chunk_rows):
+        if not len(chunk):
+            continue
+        if 'datetime' in chunk:
+            ns = to_utc_ns(chunk['datetime'])[0].view('i8').tolist()
+        else:
+            ns = [NAT] * len(chunk)
+        names = list(chunk.columns)
+        columns = [chunk[name].tolist() for name in names]
+        fill_symbol = symbol is not None and 'symbol' not in chunk
+        for ts, values in zip(ns, zip(*columns)):
+            tick = dict(zip(names, values))
+            if fill_symbol:
+                tick['symbol'] = symbol
+            yield ts, rank, row, tick
+            row += 1
+
+
+def merge_ticks(sources, chunk_rows=CHUNK_ROWS):
+    """
+    sources: {symbol: source} (or a list of sources whose rows carry their symbol).
+    Yields tick dicts in (datetime, source, row) order.
+    """
+    items = sources.items() if isinstance(sources, dict) else ((None, source) for source in sources)
+    streams = [_keyed(rank, source, symbol, chunk_rows) for rank, (symbol, source) in enumerate(items)]
+    for _, _, _, tick in heapq.merge(*streams):
+        yield tick
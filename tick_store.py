@@ -0,0 +1,184 @@
+"""
+Columnar tick store
+
+Trader used to keep each symbol's history in a DataFrame and DataFrame.append() the incoming
+tick, which copies the whole frame (and the result was thrown away). TickStore keeps one NumPy
+array per column instead:
+
+    datetime (datetime64[ns], UTC), open, high, low, close, volume
+
+Appends are amortized O(1). With max_history set the store keeps only the newest max_history
+rows, so memory per symbol is bounded for a full session. Column access returns views over the
+live rows, no copies.
+"""
+import numpy as np
+import pandas as pd
+
+TICK_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class RingBuffer:
+    """
+    1-D array with amortized O(1) appends whose live rows are always contiguous.
+
+    Unbounded buffers double when full. Bounded ones (maxlen) allocate up to 2 * maxlen and,
+    when the end is reached, slide the newest maxlen rows back to the front, i.e. one
+    O(maxlen) copy every maxlen appends.
+
+    Views handed out earlier may be overwritten by a later slide, take a copy to keep them.
+    """
+    def __init__(self, dtype=np.float64, capacity=1024, maxlen=None):
+        self.maxlen = int(maxlen) if maxlen else None
+        if self.maxlen:
+            capacity = min(capacity, 2 * self.maxlen)
+        self._buf = np.empty(max(int(capacity), 1), dtype=dtype)
+        self._start = 0
+        self._end = 0
+        self.total = 0  # rows ever appended, keeps counting once old rows are dropped
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def dtype(self):
+        return self._buf.dtype
+
+    def _make_room(self, n):
+        live = len(self)
+        size = len(self._buf)
+        while size < live + n or (not self.maxlen and size == live):
+            size *= 2
+        if self.maxlen:
+            if self._start:
+                # already dropping rows, slide within the full 2 * maxlen whatever the first capacity was
+                size = 2 * self.maxlen
+            size = max(min(size, 2 * self.maxlen), live + n)
+
+        if size != len(self._buf):
+            buf = np.empty(size, dtype=self._buf.dtype)
+        else:
+            buf = self._buf
+        buf[:live] = self._buf[self._start:self._end]
+        self._buf, self._start, self._end = buf, 0, live
+
+    def append(self, value):
+        if self._end == len(self._buf):
+            self._make_room(1)
+        self._buf[self._end] = value
+        self._end += 1
+        self.total += 1
+        if self.maxlen and len(self) > self.maxlen:
+            self._start += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._buf.dtype)
+        if self.maxlen and len(values) > self.maxlen:
+            self.total += len(values) - self.maxlen
+            values = values[-self.maxlen:]
+        if self._end + len(values) > len(self._buf):
+            self._make_room(len(values))
+        self._buf[self._end:self._end + len(values)] = values
+        self._end += len(values)
+        self.total += len(values)
+        if self.maxlen and len(self) > self.maxlen:
+            self._start = self._end - self.maxlen
+
+    def view(self):
+        return self._buf[self._start:self._end]
+
+    def clear(self):
+        self._start = self._end = 0
+
+
+def to_utc_ns(values):
+    # datetime-like column -> naive datetime64[ns] in UTC, plus the tz it came in with
+    idx = pd.DatetimeIndex(values)
+    tz = idx.tz
+    if tz is not None:
+        idx = idx.tz_convert('UTC').tz_localize(None)
+    return idx.values.astype('datetime64[ns]'), tz
+
+
+class TickStore:
+    def __init__(self, max_history=None, tz=None, capacity=1024):
+        self.max_history = max_history
+        self.tz = tz
+        self.datetime = RingBuffer('datetime64[ns]', capacity, max_history)
+        self.columns = {column: RingBuffer(np.float64, capacity, max_history) for column in TICK_COLUMNS}
+
+    @classmethod
+    def from_frame(cls, df, max_history=None):
+        store = cls(max_history=max_history, capacity=max(len(df), 1024))
+        store.extend(df)
+        return store
+
+    def __len__(self):
+        return len(self.datetime)
+
+    @property
+    def total(self):
+        return self.datetime.total
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def append(self, tick):
+        # tick is a row (Series / dict) with the TICK_COLUMNS and a datetime, other fields are ignored
+        ts = tick['datetime'] if 'datetime' in tick else None
+        if ts is None or pd.isnull(ts):
+            self.datetime.append(np.datetime64('NaT'))
+        else:
+            ts = pd.Timestamp(ts)
+            if ts.tz is not None:
+                if self.tz is None:
+                    self.tz = ts.tz
+                ts = ts.tz_convert('UTC').tz_localize(None)
+            self.datetime.append(ts.to_datetime64())
+
+        for column, buffer in self.columns.items():
+            value = tick[column] if column in tick else None
+            buffer.append(np.nan if value is None else value)
+
+    def extend(self, df):
+        if len(df) == 0:
+            return
+        if 'datetime' in df:
+            values, tz = to_utc_ns(df['datetime'])
+            if self.tz is None:
+                self.tz = tz
+            self.datetime.extend(values)
+        else:
+            self.datetime.extend(np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]'))
+
+        for column, buffer in self.columns.items():
+            buffer.extend(df[column].to_numpy(dtype=np.float64) if column in df else np.full(len(df), np.nan))
+
+    def column(self, name):
+        # raw ndarray view
+        if name == 'datetime':
+            return self.datetime.view()
+        return self.columns[name].view()
+
+    def __getitem__(self, name):
+        if name == 'datetime':
+            idx = pd.DatetimeIndex(self.datetime.view())
+            if self.tz is not None:
+                idx = idx.tz_localize('UTC').tz_convert(self.tz)
+            return pd.Series(idx, name='datetime')
+        return pd.Series(self.columns[name].view(), name=name, copy=False)
+
+    def __contains__(self, name):
+        return name == 'datetime' or name in self.columns
+
+    def frame(self):
+        # DataFrame over the live rows, pandas may consolidate (copy) the float columns
+        df = pd.DataFrame({column: buffer.view() for column, buffer in self.columns.items()}, copy=False)
+        df.insert(0, 'datetime', self['datetime'])
+        return df
+
+    def head(self, n=5):
+        return self.frame().head(n)
+
+    def tail(self, n=5):
+        return self.frame().tail(n)
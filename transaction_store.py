@@ -0,0 +1,85 @@
+"""
+Local transaction store
+
+TdAccount.get_transactions(refresh=True) used to pull the account's whole transaction history
+and re-normalize all of it every time the portfolio was refreshed after an order. The store keeps
+what was already fetched (normalized, on disk) and only asks the API for transactions from the
+date of the newest one it has, normalizing and appending just the rows it hasn't seen.
+"""
+import os
+
+import pandas as pd
+
+
+def normalize_transactions(raw_df):
+    # flatten TD's transactionItem/instrument fields, keep trades (one row per raw transaction)
+    working_trans_df = raw_df.copy()
+    df2 = pd.json_normalize(working_trans_df['transactionItem'])
+    df2.index = working_trans_df.index
+    df2.drop(columns=['accountId', 'instrument.cusip', 'instrument.assetType', 'instrument.type'], inplace=True,
+             errors='ignore')
+
+    for col in df2.columns:
+        if 'instrument.' in col:
+            name = col.split('.')[1]
+            df2[name] = df2[col]
+            df2.drop(columns=[col], inplace=True)
+
+    working_trans_df = working_trans_df[working_trans_df['type'] == 'TRADE']
+    working_trans_df['tradeType'] = working_trans_df['description']
+    working_trans_df.drop(
+        columns=['type', 'description', 'cashBalanceEffectFlag', 'fees', 'clearingReferenceNumber', 'achStatus',
+                 'transactionItem', 'subAccount'], inplace=True, errors='ignore')
+    working_trans_df = working_trans_df.merge(df2, how='outer', left_index=True, right_index=True)
+
+    return working_trans_df
+
+
+class TransactionStore:
+    def __init__(self, path):
+        self.path = path
+        self.transactions = None
+        self._known_ids = set()
+
+    def load(self):
+        if self.transactions is None:
+            if os.path.isfile(self.path):
+                # ids of every raw transaction seen, non-trades included (they aren't all kept as rows)
+                stored = pd.read_pickle(self.path)
+                self.transactions, self._known_ids = stored['transactions'], stored['known_ids']
+            else:
+                self.transactions = pd.DataFrame()
+        return self.transactions
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        pd.to_pickle({'transactions': self.transactions, 'known_ids': self._known_ids}, tmp)
+        os.replace(tmp, self.path)
+
+    @property
+    def last_transaction_date(self):
+        transactions = self.load()
+        if len(transactions) == 0 or 'transactionDate' not in transactions:
+            return None
+        return transactions['transactionDate'].max()
+
+    def sync(self, fetch):
+        """
+        fetch(start_date) -> list of raw TD transactions on or after start_date ('YYYY-MM-DD', None for
+        everything). Returns the full normalized frame.
+        """
+        transactions = self.load()
+        last_date = self.last_transaction_date
+        raw = fetch(last_date[:10] if last_date else None)
+
+        new = [transaction for transaction in raw if transaction.get('transactionId') not in self._known_ids]
+        if not new:
+            return transactions
+
+        new_df = normalize_transactions(pd.DataFrame(data=new))
+        self.transactions = pd.concat([transactions, new_df], ignore_index=True, sort=False)
+        self._known_ids.update(transaction.get('transactionId') for transaction in new)
+        self.save()
+
+        return self.transactions
@@ -6,6 +6,8 @@ from datetime import datetime
 from os import listdir
 from os.path import isfile, join
 
+from symbols import from_description
+
 timezone = pytz.timezone('EST')
 
 
@@ -15,18 +17,7 @@ def string_to_date(date):
 
 # AMD_031921C92.5
 def get_option_symbol(option):
-    underlying, exp_month, exp_day, exp_year, strike, contract_type = option['description'].split(' ')
-    exp_date = datetime.strptime("{} {} {}".format(exp_month, exp_day, exp_year), "%b %d %Y")\
-        .strftime("%m%d%y")
-    formatted_strike = strike.split(".")[0] if strike[-1] == '0' else strike
-    return f"{underlying.upper()}_{exp_date}{contract_type[0]}{formatted_strike}"
-
-
-def filter_df_by_date(df, from_date, to_date = None, key = 'datetime'):
-    from_date = timezone.localize(datetime.strptime(from_date, "%Y-%m-%d"))
-    to_date = timezone.localize(datetime.strptime(to_date, "%Y-%m-%d")) if to_date else None
-    idx = (df[key] > from_date) & ((df[key] <= to_date) if to_date else True)
-    return df[idx]
+    return from_description(option['description']).symbol
 
 
 def get_cached_option_file_name(symbol, exp, strike, type):
@@ -34,6 +25,21 @@ def get_cached_option_file_name(symbol, exp, strike, type):
     return f'{symbol}_{str(strike)}_{type}_{file_name_formatted_exp}.csv'
 
 
+def option_cache_file_name(key):
+    # (symbol, exp 'YYYY-MM-DD', strike, type) -> cache file name
+    symbol, exp, strike, type = key
+    return get_cached_option_file_name(symbol, datetime.strptime(exp, "%Y-%m-%d"), strike, type)
+
+
+def parse_cached_option_file_name(file_name):
+    # inverse of get_cached_option_file_name -> (symbol, exp, strike, type), None for other files
+    parts = file_name.rsplit('.', 1)[0].split('_')
+    if len(parts) != 4:
+        return None
+    symbol, strike, type, exp = parts
+    return symbol, exp, float(strike), type
+
+
 def save_json_to_file(name, file):
     f = open(name, "w")
     f.write(json.dumps(file))
@@ -0,0 +1,284 @@
+"""
+Implied and realized volatility
+
+Black-Scholes pricing, implied volatility and greeks over NumPy arrays: every function takes
+prices / spots / strikes / times to expiry as arrays (or scalars) broadcast against each other, so
+a whole chain times a year of bars is solved in one call.
+
+implied_volatility() is Newton's method kept inside a bracket: every step narrows [low, high]
+around the root (price is increasing in vol), and a Newton step that leaves the bracket or has
+no vega to work with is replaced by bisection. Each iteration only touches the bars that haven't
+converged. Prices outside the no-arbitrage bounds, or not converged, come back NaN.
+
+VolatilityEngine keeps the per symbol state for volatility_signal_generator (seller.py): realized
+volatility of the underlying and IV / greeks of each of its option legs, computed only for the
+rows appended since the last update.
+"""
+import numpy as np
+import pandas as pd
+
+from indicators import columns, series
+from tick_store import RingBuffer
+
+NS_PER_YEAR = 365 * 24 * 3600 * 10 ** 9
+TRADING_DAYS = 252
+TRADING_SECONDS = 6.5 * 3600  # per trading day
+SQRT_2PI = np.sqrt(2 * np.pi)
+CHUNK = 32768  # bars per block in implied_volatility
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def norm_cdf(x):
+    # erfc by Chebyshev fit (Numerical Recipes erfcc), relative error < 1.2e-7
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.5 * z)
+    erfc = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+    return np.where(x >= 0, 1 - 0.5 * erfc, 0.5 * erfc)
+
+
+def _d1_d2(spot, strike, t, vol, rate):
+    vol_t = vol * np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * t) / vol_t
+    return d1, d1 - vol_t
+
+
+def black_scholes(spot, strike, t, vol, rate=0., is_call=True):
+    # option price, t in years
+    d1, d2 = _d1_d2(spot, strike, t, vol, rate)
+    discounted = strike * np.exp(-rate * t)
+    call = spot * norm_cdf(d1) - discounted * norm_cdf(d2)
+    return np.where(is_call, call, call - spot + discounted)
+
+
+def greeks(spot, strike, t, vol, rate=0., is_call=True):
+    """
+    delta, gamma, theta (per calendar day) and vega (per vol point, i.e. 0.01) as a dict of
+    arrays.
+    """
+    d1, d2 = _d1_d2(spot, strike, t, vol, rate)
+    sqrt_t = np.sqrt(t)
+    pdf = norm_pdf(d1)
+    discounted = strike * np.exp(-rate * t)
+    decay = -spot * pdf * vol / (2 * sqrt_t)
+    return {
+        'delta': np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1),
+        'gamma': pdf / (spot * vol * sqrt_t),
+        'theta': np.where(is_call, decay - rate * discounted * norm_cdf(d2),
+                          decay + rate * discounted * norm_cdf(-d2)) / 365,
+        'vega': spot * pdf * sqrt_t / 100,
+    }
+
+
+def implied_volatility(price, spot, strike, t, rate=0., is_call=True, tol=1e-9, max_iter=100, low=1e-4,
+                       high=5.):
+    """
+    Vol at which black_scholes() gives price, solved to a relative error in price under tol. NaN
+    where the price isn't attainable for a vol in [low, high] or the solver didn't converge.
+    """
+    arrays = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (price, spot, strike, t, rate)), np.asarray(is_call, dtype=bool))
+    shape = arrays[0].shape
+    arrays = [value.ravel() for value in arrays]
+    # solved a block at a time, temporaries that fit in cache make this about twice as fast
+    result = np.empty(arrays[0].size)
+    for start in range(0, len(result), CHUNK):
+        result[start:start + CHUNK] = _implied_volatility(*(value[start:start + CHUNK] for value in arrays),
+                                                          tol, max_iter, low, high)
+    return result.reshape(shape)
+
+
+def _implied_volatility(price, spot, strike, t, rate, is_call, tol, max_iter, low, high):
+    # by put-call parity a price is intrinsic value plus the price of the out of the money option at
+    # the same vol, which is what gets solved: it's well conditioned where the in the money one isn't
+    discounted = strike * np.exp(-rate * t)
+    target = price - np.where(is_call, np.maximum(spot - discounted, 0), np.maximum(discounted - spot, 0))
+    with np.errstate(invalid='ignore'):
+        valid = (t > 0) & (spot > 0) & (strike > 0) & (target > 0) & (target < np.minimum(spot, discounted))
+
+    result = np.full(len(price), np.nan)
+    active = np.flatnonzero(valid)
+    spot, discounted, target = spot[active], discounted[active], target[active]
+    side = np.where(spot > discounted, -1., 1.)  # put / call
+    moneyness = np.log(spot / discounted)
+    sqrt_t = np.sqrt(t[active])
+    scale = np.sqrt(spot * discounted)  # the out of the money price is below this
+    with np.errstate(divide='ignore'):
+        log_target = -np.log(target / scale)
+    h_target = 1 / np.sqrt(log_target)
+    # first guess: Corrado-Miller within a standard deviation of the money, beyond it
+    # -log(price / sqrt(spot * strike)) ~ x^2 / 2s^2 + s^2 / 8 solved for s = vol * sqrt(t), with x
+    # the log moneyness
+    forward = spot - discounted
+    half = target + np.maximum(forward, 0) - forward / 2
+    with np.errstate(invalid='ignore'):
+        near = SQRT_2PI / (spot + discounted) * (half + np.sqrt(np.maximum(half * half - forward * forward / np.pi, 0)))
+        far = 2 * np.sqrt(2 * (log_target - np.sqrt(np.maximum(log_target ** 2 - moneyness ** 2 / 4, 0))))
+    vol = np.where(np.abs(moneyness) < near, near, far) / sqrt_t
+    vol = np.clip(vol, low, high)
+    lo = np.full(len(active), low)
+    hi = np.full(len(active), high)
+
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        vol_t = vol * sqrt_t
+        d1 = moneyness / vol_t + 0.5 * vol_t
+        model = side * (spot * norm_cdf(side * d1) - discounted * norm_cdf(side * (d1 - vol_t)))
+        done = np.abs(model - target) <= tol * target
+        result[active[done]] = vol[done]
+
+        # the root is below vol if the model price is too high
+        above = model > target
+        hi = np.where(above, vol, hi)
+        lo = np.where(above, lo, vol)
+        # Newton on 1 / sqrt(-log(price / sqrt(spot * strike))), which is close to linear in vol
+        # however far out of the money the option is (the price then goes like exp(-a / vol^2))
+        vega = spot * norm_pdf(d1) * sqrt_t
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            h = 1 / np.sqrt(-np.log(model / scale))
+            step = vol - 2 * (h - h_target) * model / (h * h * h * vega)
+        vol = np.where((step > lo) & (step < hi), step, 0.5 * (lo + hi))
+
+        # a bracket that collapsed without converging means no root in [low, high]
+        keep = ~done & (hi - lo > 1e-12)
+        if not keep.all():
+            active, vol, lo, hi = active[keep], vol[keep], lo[keep], hi[keep]
+            spot, discounted, target, side, moneyness, sqrt_t, scale, h_target = (
+                spot[keep], discounted[keep], target[keep], side[keep], moneyness[keep], sqrt_t[keep], scale[keep],
+                h_target[keep])
+
+    return result
+
+
+def bars_per_year(datetimes):
+    # annualization factor for bars spaced like datetimes (ns), intraday bars count trading hours only
+    if len(datetimes) < 2:
+        return TRADING_DAYS
+    seconds = np.median(np.diff(datetimes)) / 10 ** 9
+    if not seconds > 0:
+        return TRADING_DAYS
+    if seconds >= 24 * 3600:
+        return TRADING_DAYS * 24 * 3600 / seconds
+    return TRADING_DAYS * TRADING_SECONDS / seconds
+
+
+def realized_volatility(close, window=20, periods_per_year=TRADING_DAYS):
+    # annualized rolling standard deviation of log returns, NaN until window returns are available
+    close = np.asarray(close, dtype=float)
+    result = np.full(len(close), np.nan)
+    if len(close) <= window:
+        return result
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(np.log(close))
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+    result[window:] = windows.std(axis=1, ddof=1) * np.sqrt(periods_per_year)
+    return result
+
+
+def _new_rows(data, seen):
+    # rows of data appended since seen (a TickStore.total), all of them for plain DataFrames
+    total = getattr(data, 'total', len(data))
+    return min(max(total - seen, 0), len(data)), total
+
+
+class RealizedVolatility:
+    def __init__(self, window=20, periods_per_year=None, max_history=None):
+        self.window = window
+        self.periods_per_year = periods_per_year  # None infers it from the bar spacing
+        self.values = RingBuffer(np.float64, 1024, max_history)
+        self.seen = 0
+
+    def update(self, data):
+        if getattr(data, 'total', len(data)) < self.seen:
+            # history was replaced underneath us, start over
+            self.values.clear()
+            self.seen = 0
+        new, total = _new_rows(data, self.seen)
+        if new == 0:
+            return
+        datetimes, close = columns(data, ['close'])
+        if self.periods_per_year is None and len(close) > 1:
+            self.periods_per_year = bars_per_year(datetimes)
+        # the window before the new rows is needed to compute them
+        tail = close[len(close) - new - min(self.window, len(close) - new):]
+        self.values.extend(realized_volatility(tail, self.window, self.periods_per_year or TRADING_DAYS)[-new:])
+        self.seen = total
+
+    def series(self, index=None):
+        return series(self.values.view(), 'REALIZED_VOL', index)
+
+
+class LegVolatility:
+    # IV and greeks per bar of one option leg, spot taken as the underlying's last close at or before the bar
+    NAMES = ['IV', 'DELTA', 'GAMMA', 'THETA', 'VEGA']
+
+    def __init__(self, strike, expiration, is_call, rate=0., max_history=None):
+        self.strike = float(strike)
+        self.expiration = pd.Timestamp(expiration).value
+        self.is_call = is_call
+        self.rate = rate
+        self.values = {name: RingBuffer(np.float64, 1024, max_history) for name in self.NAMES}
+        self.seen = 0
+
+    @classmethod
+    def from_position(cls, position, rate=0., max_history=None):
+        return cls(position['strike'], position['optionExpirationDate'], position['putCall'] == 'CALL', rate,
+                   max_history)
+
+    def update(self, data, underlying):
+        # whether the series changed
+        reset = getattr(data, 'total', len(data)) < self.seen
+        if reset:
+            # history was replaced underneath us, start over
+            for values in self.values.values():
+                values.clear()
+            self.seen = 0
+        new, total = _new_rows(data, self.seen)
+        if new == 0:
+            return reset
+        datetimes, close = columns(data, ['close'])
+        close, datetimes = close[-new:], datetimes[-new:]
+        under_datetimes, under_close = columns(underlying, ['close'])
+        index = np.searchsorted(under_datetimes, datetimes, side='right') - 1
+        spot = np.where(index >= 0, under_close[np.maximum(index, 0)], np.nan) if len(under_close) else \
+            np.full(new, np.nan)
+        t = (self.expiration - datetimes) / NS_PER_YEAR
+
+        iv = implied_volatility(close, spot, self.strike, t, self.rate, self.is_call)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = greeks(spot, self.strike, t, iv, self.rate, self.is_call)
+        values['iv'] = iv
+        for name in self.NAMES:
+            self.values[name].extend(values[name.lower()])
+        self.seen = total
+        return True
+
+    def series(self, name, index=None):
+        return series(self.values[name].view(), name, index)
+
+
+class VolatilityEngine:
+    def __init__(self, window=20, rate=0., max_history=None):
+        self.realized = RealizedVolatility(window, max_history=max_history)
+        self.rate = rate
+        self.max_history = max_history
+        self.legs = {}  # leg symbol -> LegVolatility
+
+    def update(self, data, legs):
+        # legs: leg symbol -> Trader symbol info (position, data), returns the legs with new rows
+        self.realized.update(data)
+        for symbol in list(self.legs):
+            if symbol not in legs:
+                del self.legs[symbol]
+        updated = []
+        for symbol, info in legs.items():
+            leg = self.legs.get(symbol)
+            if leg is None:
+                leg = self.legs[symbol] = LegVolatility.from_position(info['position'], self.rate, self.max_history)
+            if leg.update(info['data'], data):
+                updated.append(symbol)
+        return updated
@@ -0,0 +1,100 @@
+"""
+Volume features
+
+VolumeEngine keeps the per symbol state for volume_signal_generator (seller.py), fed only the rows
+appended since its last update, each in O(1):
+
+    VWAP            session VWAP of the typical price (high + low + close) / 3, reset every day
+    VOLUME_SMA_<n>  rolling mean volume over n bars (StreamingSMA, same values as pandas)
+    RVOL            session volume so far over the average session volume by the same time of day
+
+The time of day averages come from a VolumeProfile built once from the history the engine first
+sees: cumulative volume by minute of the day (in the engine's tz), averaged over the complete
+days of history. A live row only looks up its minute.
+"""
+import numpy as np
+import pandas as pd
+
+from indicators import NAT, StreamingSMA, columns, series
+from tick_store import RingBuffer
+
+MINUTE = 60 * 10 ** 9
+MINUTES_PER_DAY = 24 * 60
+
+
+class VolumeProfile:
+    def __init__(self, cumulative, days=0):
+        self.cumulative = cumulative  # average volume traded by the end of each minute of the day
+        self.days = days
+
+    @classmethod
+    def from_history(cls, datetimes, volume, tz='EST'):
+        # datetimes as int64 ns UTC, the last day is left out as it may still be trading
+        valid = (datetimes != NAT) & ~np.isnan(volume)
+        if not valid.any():
+            return cls(np.zeros(MINUTES_PER_DAY))
+        index = pd.DatetimeIndex(datetimes[valid].view('M8[ns]')).tz_localize('UTC').tz_convert(tz)
+        days, day = np.unique(index.normalize().asi8, return_inverse=True)
+        grid = np.zeros((len(days), MINUTES_PER_DAY))
+        np.add.at(grid, (day, index.hour * 60 + index.minute), volume[valid])
+        if len(days) > 1:
+            grid = grid[:-1]
+        return cls(grid.cumsum(axis=1).mean(axis=0), len(grid))
+
+    def expected(self, minute):
+        return self.cumulative[minute]
+
+
+class VolumeEngine:
+    def __init__(self, windows=(20,), tz='EST', max_history=None):
+        self.tz = tz
+        self.smas = {'VOLUME_SMA_{}'.format(window): StreamingSMA(window) for window in windows}
+        self.names = ['VWAP', 'RVOL'] + list(self.smas)
+        self.outputs = {name: RingBuffer(np.float64, 1024, max_history) for name in self.names}
+        self.profile = None
+        self.seen = 0
+        self._day = (0, 0)  # ns bounds of the current session
+        self._price_volume = 0.
+        self._volume = 0.
+
+    def _minute(self, ts):
+        # minute of the day ts falls on, starting a new session when it's past the current one
+        start, end = self._day
+        if not start <= ts < end:
+            day = pd.Timestamp(ts, tz='UTC').tz_convert(self.tz).normalize()
+            start, end = day.value, (day + pd.Timedelta(days=1)).normalize().value
+            self._day = (start, end)
+            self._price_volume = self._volume = 0.
+        return (ts - start) // MINUTE
+
+    def add(self, ts, high, low, close, volume):
+        minute = self._minute(ts) if ts != NAT else None
+        volume = 0. if volume != volume else volume
+        price = (high + low + close) / 3 if high == high and low == low else close
+
+        if price == price:
+            self._price_volume += price * volume
+            self._volume += volume
+        expected = self.profile.expected(minute) if minute is not None and self.profile is not None else 0.
+
+        outputs = self.outputs
+        outputs['VWAP'].append(self._price_volume / self._volume if self._volume > 0 else price)
+        outputs['RVOL'].append(self._volume / expected if expected > 0 else np.nan)
+        for name, sma in self.smas.items():
+            outputs[name].append(sma.update(volume))
+
+    def update(self, data):
+        total = getattr(data, 'total', len(data))
+        new = min(max(total - self.seen, 0), len(data))
+        if new == 0:
+            return
+        history = columns(data, ['high', 'low', 'close', 'volume'])
+        if self.profile is None:
+            # history is whatever the symbol has on its first update
+            self.profile = VolumeProfile.from_history(history[0], history[4], self.tz)
+        for row in zip(*(column[-new:].tolist() for column in history)):
+            self.add(*row)
+        self.seen = total
+
+    def series(self, name, index=None):
+        return series(self.outputs[name].view(), name, index)